@@ -1,6 +1,14 @@
 import csv
+import hashlib
+import itertools
+import multiprocessing
 import numpy as np
+import os
 import random
+import re
+import shutil
+import sqlite3
+import tempfile
 
 '''
 File format: input is a csv file or sqlite3 file
@@ -10,6 +18,8 @@ Each following row represents a data point (each column contains data for a attr
 
 Data Types: int, float, boolean, text
 Booleans can be represented as true/false or X/[empty cell]
+
+sqlite3 files are read from a table, the data types come from the declared column types
 '''
 
 def convert_str_to_np_type(type_str):
@@ -21,39 +31,575 @@ def convert_str_to_np_type(type_str):
 	}
 	return types_dict[type_str]
 
+# boolean cells holding any of these (in any case) are true, everything else is false
+BOOLEAN_TRUE_VALUES = ['true', 'x', 'yes']
+
+# text columns are stored as integer codes into a per-column vocabulary
+CODE_DTYPE = np.dtype(np.int32)
+
+# files with these extensions are read as sqlite3 databases
+SQLITE_EXTENSIONS = ['sqlite', 'sqlite3', 'db']
+
 def is_numeric(attribute_datatype):
 	return attribute_datatype == str(np.dtype(int)) or attribute_datatype == str(np.dtype(float))
 
+def encode_values(vocabulary, values):
+	# codes of values in a sorted vocabulary, values missing from it get -1
+	if vocabulary.shape[0] == 0:
+		return np.full(np.shape(values), -1, dtype=CODE_DTYPE)
+	codes = np.minimum(np.searchsorted(vocabulary, values), vocabulary.shape[0] - 1)
+	return np.where(vocabulary[codes] == values, codes, -1).astype(CODE_DTYPE)
+
+def category_set(threshold):
+	# the categories of a non-numeric split, a single value is a set of one
+	return threshold if isinstance(threshold, (np.ndarray, list, tuple)) else [threshold]
+
+def encode_column(column):
+	# returns (vocabulary, codes) with the vocabulary sorted so codes compare like the values
+	vocabulary, codes = np.unique(column, return_inverse=True)
+	return (vocabulary, codes.astype(CODE_DTYPE))
+
+class ColumnEncoder():
+	# dictionary-encodes a text column chunk by chunk, codes follow first appearance until finish()
+
+	def __init__(self):
+		self.codes = {}
+
+	def encode(self, values):
+		uniques, inverse = np.unique(values, return_inverse=True)
+		codes = self.codes
+		return np.array([codes.setdefault(value, len(codes)) for value in uniques], dtype=CODE_DTYPE)[inverse]
+
+	def finish(self, codes):
+		# renumbers codes in place in sorted vocabulary order and returns the vocabulary
+		vocabulary = np.empty(len(self.codes), dtype=object)
+		for value, code in self.codes.items():
+			vocabulary[code] = value
+		order = np.argsort(vocabulary, kind='mergesort')
+		rank = np.empty(order.shape[0], dtype=CODE_DTYPE)
+		rank[order] = np.arange(order.shape[0])
+		codes[:] = rank[codes]
+		return vocabulary[order]
+
+def convert_sqlite_type(declared_type):
+	# follows sqlite's type affinity rules, with BOOL columns read as booleans
+	declared_type = (declared_type or '').upper()
+	if 'BOOL' in declared_type:
+		return np.dtype(bool)
+	if 'INT' in declared_type:
+		return np.dtype(int)
+	if 'CHAR' in declared_type or 'CLOB' in declared_type or 'TEXT' in declared_type or 'BLOB' in declared_type or not declared_type:
+		return np.dtype(object)
+	return np.dtype(float)
+
+def quantile_values(column, n_bins):
+	# the lowest value of every bin: numeric columns get at most n_bins quantile bins, other columns one bin per value
+	values = np.unique(column)
+	if is_numeric(column.dtype) and values.shape[0] > n_bins:
+		values = np.unique(np.percentile(column, np.linspace(0, 100, n_bins, endpoint=False), interpolation='lower'))
+	return values
+
+def assign_bins(values, column):
+	# bin of every value of a column given the lowest value of each bin, values below the first bin's go in it
+	bins = np.maximum(np.searchsorted(values, column, side='right') - 1, 0)
+	return bins.astype(np.uint8 if values.shape[0] <= 256 else np.uint16)
+
+def quantile_bins(column, n_bins):
+	# returns (values, bins) where bins[i] is the bin of column[i] and values[b] is the lowest value in bin b
+	values = quantile_values(column, n_bins)
+	return (values, assign_bins(values, column))
+
+def read_csv_header(filename):
+	# returns (attributes, dtypes, byte offset of the first datapoint)
+	# The first row should be the column titles/attributes
+	# The second row should be the types of the column's data ('int', 'float', 'boolean', 'text')
+	# files are opened with universal newlines, so lines may end with \n, \r\n or \r
+	with open(filename, 'rU') as csv_file:
+		attributes = next(csv.reader([csv_file.readline()]))
+		dtypes = [convert_str_to_np_type(elt) for elt in next(csv.reader([csv_file.readline()]))]
+		return (attributes, dtypes, csv_file.tell())
+
+def count_lines(filename, offset=0, block_size=1 << 20):
+	# upper bound on the number of csv rows after offset, used to preallocate columns
+	# a line ends with \n, \r\n or \r, a \r\n split between two blocks is counted once
+	count = 0
+	last = '\n'
+	with open(filename, 'rb') as csv_file:
+		csv_file.seek(offset)
+		block = csv_file.read(block_size)
+		while block:
+			count += block.count('\n') + block.count('\r') - block.count('\r\n') - (last == '\r' and block[0] == '\n')
+			last = block[-1]
+			block = csv_file.read(block_size)
+	return count + (last not in '\r\n')
+
+def convert_csv_columns(rows, dtypes, columns=None):
+	# converts a chunk of csv rows (lists of strings) into one typed array per column
+	# columns optionally selects the indices of the only columns to convert
+	cells = zip(*rows) if rows else [()] * len(dtypes)
+	if columns is not None:
+		cells, dtypes = [cells[index] for index in columns], [dtypes[index] for index in columns]
+	columns = []
+	for values, dtype in zip(cells, dtypes):
+		if dtype == np.dtype(bool):
+			column = np.in1d(np.char.lower(np.array(values, dtype=str)), BOOLEAN_TRUE_VALUES)
+		elif dtype == np.dtype(object):
+			column = np.empty(len(values), dtype=object)
+			column[:] = values
+		else:
+			column = np.array(values, dtype=dtype)
+		columns.append(column)
+	return columns
+
+def csv_blocks(filename, offset, block_size):
+	# (start, end) byte ranges of roughly block_size that begin and end on line boundaries
+	size = os.path.getsize(filename)
+	starts = [offset]
+	with open(filename, 'rU') as csv_file:
+		while starts[-1] + block_size < size:
+			csv_file.seek(starts[-1] + block_size)
+			csv_file.readline()
+			if csv_file.tell() >= size:
+				break
+			starts.append(csv_file.tell())
+	return zip(starts, starts[1:] + [size])
+
+def read_csv_block(filename, dtypes, start, end, columns=None):
+	# typed columns of the rows in a byte range from csv_blocks
+	with open(filename, 'rb') as csv_file:
+		csv_file.seek(start)
+		lines = csv_file.read(end - start).splitlines()
+	return convert_csv_columns([row for row in csv.reader(lines) if row], dtypes, columns)
+
+def _read_csv_block(arguments):
+	return read_csv_block(*arguments)
+
+def iter_csv_chunks(filename, dtypes, offset, chunk_size=65536, n_jobs=1, block_size=1 << 25, columns=None):
+	# yields the datapoints after offset as lists of typed column chunks
+	# with n_jobs > 1 byte blocks are parsed in worker processes, which assumes no quoted newlines
+	# columns optionally selects the indices of the only columns to convert
+	if n_jobs == 1:
+		with open(filename, 'rU') as csv_file:
+			csv_file.seek(offset)
+			reader = csv.reader(csv_file)
+			while True:
+				rows = [row for row in itertools.islice(reader, chunk_size) if row]
+				if not rows:
+					break
+				yield convert_csv_columns(rows, dtypes, columns)
+		return
+
+	tasks = [(filename, dtypes, start, end, columns) for start, end in csv_blocks(filename, offset, block_size)]
+	pool = multiprocessing.Pool(n_jobs)
+	try:
+		# one block per worker at a time keeps memory bounded
+		for index in range(0, len(tasks), n_jobs):
+			for chunk in pool.map(_read_csv_block, tasks[index:index + n_jobs]):
+				yield chunk
+	finally:
+		pool.close()
+		pool.join()
+
+def read_csv_columns(filename, chunk_size=65536, n_jobs=1):
+	# streams a csv file into preallocated typed columns without building python rows for the whole file
+	# text columns are dictionary-encoded as they are read
+	attributes, dtypes, offset = read_csv_header(filename)
+	capacity = count_lines(filename, offset)
+	encoders = [ColumnEncoder() if dtype == np.dtype(object) else None for dtype in dtypes]
+	columns = [np.empty(capacity, dtype=CODE_DTYPE if encoder else dtype) for dtype, encoder in zip(dtypes, encoders)]
+	size = 0
+	for chunk in iter_csv_chunks(filename, dtypes, offset, chunk_size, n_jobs):
+		rows = chunk[0].shape[0] if chunk else 0
+		for column, encoder, values in zip(columns, encoders, chunk):
+			column[size:size + rows] = encoder.encode(values) if encoder else values
+		size += rows
+	return encoded_store(attributes, dtypes, [column[:size] for column in columns], encoders)
+
+def encoded_store(names, dtypes, columns, encoders):
+	# builds a ColumnStore from columns read with a ColumnEncoder for each text column
+	vocabularies = {}
+	for name, column, encoder in zip(names, columns, encoders):
+		if encoder:
+			vocabularies[name] = encoder.finish(column)
+	return ColumnStore(dict(zip(names, columns)), names, dtypes=dict(zip(names, dtypes)), vocabularies=vocabularies)
+
+def file_cache_key(filename, sample_size=1 << 20):
+	# identifies a version of a file by its size, mtime and a hash of its first, middle and last blocks
+	# hashing sampled blocks keeps the lookup fast for multi-GB files
+	stat = os.stat(filename)
+	digest = hashlib.sha1('%d:%r' % (stat.st_size, stat.st_mtime))
+	with open(filename, 'rb') as source:
+		for offset in sorted(set([0, max(0, stat.st_size // 2 - sample_size // 2), max(0, stat.st_size - sample_size)])):
+			source.seek(offset)
+			digest.update(source.read(sample_size))
+	return digest.hexdigest()
+
+def cache_prefix(filename):
+	# caches of a csv file are named after its basename and a hash of its absolute path, so files of the same name
+	# in different directories can share a cache_dir, followed by the file_cache_key of the cached version
+	return '%s-%s-' % (os.path.basename(filename), hashlib.sha1(os.path.abspath(filename)).hexdigest())
+
+def remove_stale_caches(filename, cache_dir, keep=None):
+	# removes the caches of earlier versions of a csv file, all of its caches if keep is None
+	# caches removed concurrently by another process are skipped; columns a reader already memory-mapped stay
+	# readable after their files are removed, columns it hadn't loaded yet are gone
+	pattern = re.compile(re.escape(cache_prefix(filename)) + '[0-9a-f]{40}$')
+	for name in os.listdir(cache_dir):
+		if pattern.match(name) and os.path.join(cache_dir, name) != keep:
+			shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+
+def load_cached_csv(filename, cache_dir, n_jobs=1):
+	# memory-maps the columnar cache of a csv file, building the cache first if the file has changed
+	# building a new cache removes those of the file's earlier versions
+	directory = os.path.join(cache_dir, cache_prefix(filename) + file_cache_key(filename))
+	if not os.path.exists(os.path.join(directory, ColumnStore.SCHEMA_FILENAME)):
+		if not os.path.exists(cache_dir):
+			os.makedirs(cache_dir)
+		# build the cache next to its final location and move it in place so readers never see half a cache
+		staging = tempfile.mkdtemp(dir=cache_dir)
+		try:
+			read_csv_columns(filename, n_jobs=n_jobs).save(staging)
+			os.rename(staging, directory)
+		except OSError:
+			# another process finished the same cache first
+			if not os.path.exists(directory):
+				raise
+		finally:
+			if os.path.exists(staging):
+				shutil.rmtree(staging)
+		remove_stale_caches(filename, cache_dir, keep=directory)
+	return ColumnStore.load(directory)
+
+def quote_identifier(name):
+	return '"%s"' % name.replace('"', '""')
+
+def convert_sqlite_column(values, dtype, name=None):
+	# converts one column of a fetched batch into a typed array, NULL floats become nan
+	# integer columns can't hold NULLs, declare such columns REAL to read them as nan
+	if dtype == np.dtype(bool):
+		if any(isinstance(value, str) for value in values):
+			return np.in1d(np.char.lower(np.array([value or '' for value in values], dtype=str)), BOOLEAN_TRUE_VALUES)
+		return np.array([bool(value) for value in values], dtype=bool)
+	if dtype == np.dtype(object):
+		column = np.empty(len(values), dtype=object)
+		column[:] = values
+		return column
+	if dtype == np.dtype(int) and None in values:
+		raise ValueError('Integer column %s has NULL values.' % name)
+	return np.array(values, dtype=dtype)
+
+def read_sqlite_columns(filename, table=None, attributes=None, limit=None, sample=None, batch_size=65536):
+	# reads a table in batches into typed columns
+	# only the given attributes are selected, and the optional row limit and
+	# sample fraction are applied by the query, so unused data is never read
+	connection = sqlite3.connect(filename)
+	connection.text_factory = str
+	try:
+		if table is None:
+			tables = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+			if len(tables) != 1:
+				raise ValueError('A table must be given for a sqlite3 file with %d tables.' % len(tables))
+			table = tables[0]
+
+		declared_types = [(row[1], row[2]) for row in connection.execute('PRAGMA table_info(%s)' % quote_identifier(table))]
+		if not declared_types:
+			raise ValueError('Table %s does not exist.' % table)
+		if attributes is not None:
+			declared_types = dict(declared_types)
+			missing = [attribute for attribute in attributes if attribute not in declared_types]
+			if missing:
+				raise ValueError('Table %s has no columns %s.' % (table, ', '.join(missing)))
+			declared_types = [(attribute, declared_types[attribute]) for attribute in attributes]
+		names = [name for name, declared_type in declared_types]
+		dtypes = [convert_sqlite_type(declared_type) for name, declared_type in declared_types]
+
+		query = 'SELECT %s FROM %s' % (', '.join(quote_identifier(name) for name in names), quote_identifier(table))
+		if sample is not None:
+			query += ' WHERE abs(random() %% 1000000) < %d' % int(sample * 1000000)
+		if limit is not None:
+			query += ' LIMIT %d' % limit
+
+		# the buffers start at one batch and double as rows arrive, counting the table first would be another full scan
+		capacity = batch_size if limit is None else min(limit, batch_size)
+		encoders = [ColumnEncoder() if dtype == np.dtype(object) else None for dtype in dtypes]
+		columns = [np.empty(capacity, dtype=CODE_DTYPE if encoder else dtype) for dtype, encoder in zip(dtypes, encoders)]
+		size = 0
+
+		cursor = connection.execute(query)
+		rows = cursor.fetchmany(batch_size)
+		while rows:
+			if size + len(rows) > capacity:
+				capacity = max(2 * capacity, size + len(rows))
+				columns = [np.concatenate([column[:size], np.empty(capacity - size, dtype=column.dtype)]) for column in columns]
+			for index, values in enumerate(zip(*rows)):
+				values = convert_sqlite_column(values, dtypes[index], names[index])
+				columns[index][size:size + len(rows)] = encoders[index].encode(values) if encoders[index] else values
+			size += len(rows)
+			rows = cursor.fetchmany(batch_size)
+	finally:
+		connection.close()
+
+	return encoded_store(names, dtypes, [column[:size] for column in columns], encoders)
+
+def sample_without_replacement(population, size, random_state):
+	# ascending distinct positions below population drawn uniformly; small samples are topped up with fresh draws
+	# until enough are distinct, which needs memory proportional to the sample rather than to the population
+	if size > population:
+		raise ValueError('Cannot take a larger sample than the population without replacement.')
+	if 2 * size > population:
+		return np.sort(random_state.permutation(population)[:size])
+	drawn = np.unique(random_state.randint(0, population, size=size))
+	while drawn.shape[0] < size:
+		drawn = np.unique(np.concatenate([drawn, random_state.randint(0, population, size=size - drawn.shape[0])]))
+	return drawn
+
+class ColumnStore():
+	# one set of column vectors shared by every DataSet view built on top of it
+	# text columns are dictionary-encoded: columns holds their codes and vocabularies their sorted values,
+	# dtypes always holds the type of the values
+	# columns may be loaded lazily: loader(name) is called the first time a missing column is accessed
+
+	SCHEMA_FILENAME = 'schema.csv'
+
+	def __init__(self, columns, names, dtypes=None, length=None, loader=None, vocabularies=None):
+		self.columns = columns
+		self.names = tuple(names)
+		self.dtypes = dtypes if dtypes is not None else dict((name, columns[name].dtype) for name in names)
+		self.length = length if length is not None else (columns[self.names[0]].shape[0] if self.names else 0)
+		self.loader = loader
+		self.vocabularies = vocabularies if vocabularies is not None else {}
+		# small per-column summaries of the whole store: bin values by (name, n_bins),
+		# and the distinct values of columns not stored encoded
+		self.bins = {}
+		self.distinct = {}
+		# the directory a loaded store is memory-mapped from
+		self.directory = None
+
+		for name in self.names:
+			if self.dtypes[name] == np.dtype(object) and name not in self.vocabularies:
+				self.vocabularies[name], self.columns[name] = encode_column(self.columns[name])
+
+	@classmethod
+	def from_records(cls, datapoints):
+		# converts a structured array into contiguous columns
+		datapoints = np.array(datapoints, copy=False, ndmin=1)
+		return cls(dict((name, np.ascontiguousarray(datapoints[name])) for name in datapoints.dtype.names), datapoints.dtype.names)
+
+	def __getitem__(self, name):
+		# the stored column, codes for dictionary-encoded columns
+		if name not in self.columns:
+			if name not in self.dtypes or self.loader is None:
+				raise KeyError(name)
+			self.columns[name] = self.loader(name)
+		return self.columns[name]
+
+	def __contains__(self, name):
+		return name in self.dtypes
+
+	def __len__(self):
+		return self.length
+
+	def dtype(self, name):
+		return self.dtypes[name]
+
+	def is_encoded(self, name):
+		return name in self.vocabularies
+
+	def get_values(self, name, rows=None):
+		# decoded column values, optionally only of the given rows
+		column = self[name] if rows is None else self[name][rows]
+		if name in self.vocabularies:
+			return self.vocabularies[name][column]
+		return column
+
+	def get_vocabulary(self, name, chunk_size=1 << 20):
+		# sorted distinct values of a column, found for columns not stored encoded in one pass over chunks of it
+		if name in self.vocabularies:
+			return self.vocabularies[name]
+		if name not in self.distinct:
+			column = self[name]
+			vocabulary = np.unique(column[:chunk_size])
+			for start in range(chunk_size, column.shape[0], chunk_size):
+				vocabulary = np.union1d(vocabulary, column[start:start + chunk_size])
+			self.distinct[name] = vocabulary
+		return self.distinct[name]
+
+	def get_codes(self, name, rows=None):
+		# (vocabulary, codes) of any column, optionally only of the given rows
+		# columns that aren't stored encoded are encoded by searching the vocabulary for the values read, only
+		# the vocabulary is kept
+		vocabulary = self.get_vocabulary(name)
+		if name in self.vocabularies:
+			return (vocabulary, self[name] if rows is None else self[name][rows])
+		return (vocabulary, np.searchsorted(vocabulary, self.get_values(name, rows)).astype(CODE_DTYPE))
+
+	def get_bin_values(self, name, n_bins, sample_size=1 << 20):
+		# lowest value of every bin of a column (see quantile_values), the quantiles of columns longer than
+		# sample_size are those of a fixed random sample of sample_size rows; shared by every view of the store
+		if (name, n_bins) not in self.bins:
+			if not is_numeric(self.dtypes[name]):
+				self.bins[(name, n_bins)] = self.get_vocabulary(name)
+			else:
+				column = self[name]
+				if column.shape[0] > sample_size:
+					column = column[sample_without_replacement(column.shape[0], sample_size, np.random.RandomState(0))]
+				self.bins[(name, n_bins)] = quantile_values(column, n_bins)
+		return self.bins[(name, n_bins)]
+
+	def get_bins(self, name, n_bins, rows=None):
+		# (values, bins) of a column, optionally only of the given rows, binned by get_bin_values
+		# only the rows asked for are read and binned
+		values = self.get_bin_values(name, n_bins)
+		if not is_numeric(self.dtypes[name]):
+			codes = self.get_codes(name, rows)[1]
+			return (values, codes.astype(np.uint8 if values.shape[0] <= 256 else np.uint16) if values.shape[0] <= 65536 else codes)
+		return (values, assign_bins(values, self.get_values(name, rows)))
+
+	def save(self, directory):
+		# writes one .npy file per column plus a schema so other processes can memory-map them
+		# the codes of text columns are mapped, their vocabularies are stored next to them
+		with open(os.path.join(directory, self.SCHEMA_FILENAME), 'wb') as schema_file:
+			writer = csv.writer(schema_file)
+			writer.writerow(self.names)
+			writer.writerow([str(self.dtypes[name]) for name in self.names])
+			writer.writerow([self.length])
+		for index, name in enumerate(self.names):
+			np.save(os.path.join(directory, '%d.npy' % index), self[name])
+			if name in self.vocabularies:
+				np.save(os.path.join(directory, '%d.vocabulary.npy' % index), self.vocabularies[name])
+
+	@classmethod
+	def load(cls, directory, mmap_mode='r'):
+		# columns are only read when first accessed
+		with open(os.path.join(directory, cls.SCHEMA_FILENAME), 'rb') as schema_file:
+			reader = csv.reader(schema_file)
+			names = next(reader)
+			dtypes = dict((name, np.dtype(dtype)) for name, dtype in zip(names, next(reader)))
+			length = int(next(reader)[0])
+		paths = dict((name, os.path.join(directory, '%d.npy' % index)) for index, name in enumerate(names))
+		vocabularies = {}
+		for index, name in enumerate(names):
+			if dtypes[name] == np.dtype(object):
+				vocabularies[name] = np.load(os.path.join(directory, '%d.vocabulary.npy' % index), allow_pickle=True)
+
+		def loader(name):
+			return np.load(paths[name], mmap_mode=mmap_mode)
+
+		store = cls({}, names, dtypes=dtypes, length=length, loader=loader, vocabularies=vocabularies)
+		store.directory = directory
+		return store
+
 class DataSet():
 
 	# either filename or datapoints and datatypes must be given
-	def __init__(self, filename=None, datapoints=None, ratio_validation=None, shuffle=False):
-		if not filename and (datapoints is None):
+	# store, rows and attributes build a view onto another DataSet's columns without copying them
+	# weights optionally gives each of the view's rows an integer multiplicity (e.g. a bootstrap sample)
+	# n_jobs > 1 parses csv files in parallel worker processes
+	# cache_dir keeps a memory-mapped columnar copy of csv files so later loads skip parsing
+	# sqlite3 files are read from table (optional if there is only one), loading only the given
+	# attributes and at most limit rows, or a random sample fraction of the rows
+	def __init__(self, filename=None, datapoints=None, ratio_validation=None, shuffle=False, store=None, rows=None, attributes=None, weights=None, n_jobs=1, cache_dir=None, table=None, limit=None, sample=None):
+		if not filename and (datapoints is None) and store is None:
 			raise ValueError('Either a filename or an array of datapoints and list of datatypes must be given.')
 
-		if datapoints is None:
-			if filename.split('.')[-1] == 'csv':
-				datapoints = self.init_data_from_csv(filename)
+		if store is None:
+			if datapoints is None:
+				if filename.split('.')[-1] == 'csv' and cache_dir:
+					store = load_cached_csv(filename, cache_dir, n_jobs=n_jobs)
+				elif filename.split('.')[-1] == 'csv':
+					store = read_csv_columns(filename, n_jobs=n_jobs)
+				elif filename.split('.')[-1] in SQLITE_EXTENSIONS:
+					store = read_sqlite_columns(filename, table=table, attributes=attributes, limit=limit, sample=sample)
+			else:
+				store = ColumnStore.from_records(datapoints)
 
-		if shuffle:
-			np.random.shuffle(datapoints)
+		self.store = store
+		self.rows = rows
+		self.weights = weights
+		self.attributes = tuple(attributes) if attributes is not None else store.names
 
-		self.datapoints = datapoints
+		if shuffle:
+			self.rows, self.weights = self.select_rows(np.random.permutation(self.count_rows()))
 
 		if ratio_validation:
-			validation_split = int((1-ratio_validation) * datapoints.shape[0]) if datapoints.shape else None
-			self.datapoints = datapoints[:validation_split]
-			self.validation_datapoints = datapoints[validation_split:]
+			validation_split = int((1-ratio_validation) * self.count_rows())
+			self.validation = self.view(*self.select_rows(slice(validation_split, None)))
+			self.rows, self.weights = self.select_rows(slice(None, validation_split))
+
+	def view(self, rows=None, weights=None, attributes=None):
+		# a new DataSet sharing this one's column store
+		# weights are only inherited when the rows are
+		if rows is None:
+			rows, weights = self.rows, self.weights
+		if attributes is None:
+			attributes = self.attributes
+		return DataSet(store=self.store, rows=rows, attributes=attributes, weights=weights)
+
+	def select_rows(self, selection):
+		# row indices and weights of the view's rows picked by a mask, slice or positions
+		weights = self.weights[selection] if self.weights is not None else None
+		return (self.get_row_indices()[selection], weights)
+
+	def materialize(self):
+		# explicit copy of the view into its own compact column store, text columns stay encoded
+		columns = {}
+		for attribute in self.attributes:
+			column = self.store[attribute] if self.rows is None else self.store[attribute][self.rows]
+			columns[attribute] = np.repeat(column, self.weights) if self.weights is not None else np.array(column)
+		dtypes = dict((attribute, self.store.dtype(attribute)) for attribute in self.attributes)
+		vocabularies = dict((attribute, self.store.vocabularies[attribute]) for attribute in self.attributes if self.store.is_encoded(attribute))
+		return DataSet(store=ColumnStore(columns, self.attributes, dtypes=dtypes, vocabularies=vocabularies))
+
+	@property
+	def datapoints(self):
+		# builds a structured array of the view, repeating weighted rows; this copies the data
+		datapoints = np.empty(len(self), dtype=[(attribute, self.store.dtype(attribute)) for attribute in self.attributes])
+		for attribute in self.attributes:
+			datapoints[attribute] = self.get_column_vector(attribute)
+		return datapoints
+
+	@property
+	def validation_datapoints(self):
+		return self.validation.datapoints
+
+	def get_row_indices(self):
+		# indices of the view's rows in the shared column store
+		return self.rows if self.rows is not None else np.arange(len(self.store))
+
+	def count_rows(self):
+		# number of distinct store rows in the view, ignoring weights
+		return self.rows.shape[0] if self.rows is not None else len(self.store)
+
+	def get_weights(self):
+		# multiplicity of each of the view's rows, None when every row counts once
+		return self.weights
+
+	def get_column(self, attribute):
+		# the view's column values, only copied when the view covers a subset of the store or is encoded
+		return self.store.get_values(attribute, self.rows)
+
+	def get_codes(self, attribute):
+		# (vocabulary, codes) of the view's column, codes index the sorted vocabulary of the whole store
+		return self.store.get_codes(attribute, self.rows)
+
+	def get_vocabulary(self, attribute):
+		# sorted distinct values of the column over the whole store, without encoding the view's rows
+		return self.store.get_vocabulary(attribute)
+
+	def is_encoded(self, attribute):
+		return self.store.is_encoded(attribute)
+
+	def get_bins(self, attribute, n_bins):
+		# (values, bins) of the view's column binned by bin values of the whole store, see ColumnStore.get_bins
+		return self.store.get_bins(attribute, n_bins, self.rows)
 
 	def select_columns(self, attributes):
-		datapoints = self.datapoints[attributes]
-		datatypes = [(name, dtype) for name, dtype in self.datapoints.dtype.fields.items() if name in attributes]
-		return DataSet(datapoints=datapoints,)
+		return self.view(attributes=[attribute for attribute in attributes if attribute in self.store])
 
 	def get_random_feature_projection(self, label, m):
 		# add 1 to m to account for label
 		m += 1
-		attribute_sample = random.sample([dtype for dtype in self.datapoints.dtype.names], m)
+		attribute_sample = random.sample(list(self.attributes), m)
 		if label not in attribute_sample:
 			attribute_sample[-1] = label
 		return self.select_columns(attribute_sample)
@@ -61,65 +607,72 @@ class DataSet():
 	def count_labels(self, label):
 		# label is a the name of a column in the spreadsheet
 		# this counts the number of occurences of each label value
-		counts = {}
-		for point in self.datapoints:
-			counts[point[label]] = counts.get(point[label], 0) + 1
-		return counts
+		values, codes = self.get_codes(label)
+		counts = np.bincount(codes, weights=self.weights, minlength=values.shape[0])
+		return dict((value, int(count)) for value, count in zip(values, counts) if count > 0)
 
 	def split_data(self, attribute, threshold):
 		# if attribute represents a numeric datatype, split into < threshold and >= threshold
-		# otherwise split into != threshold and == threshold
-		# not efficient for multiple splits
-		attribute_datatype = self.datapoints.dtype[attribute]
-		split_datapoints = None
-		if is_numeric(attribute_datatype):
-			split_datapoints = (self.datapoints[self.datapoints[attribute] < threshold], self.datapoints[self.datapoints[attribute] >= threshold])
+		# otherwise threshold is a category or an array of categories, rows in it go right
+		if is_numeric(self.get_attribute_datatype(attribute)):
+			right = self.get_column(attribute) >= threshold
 		else:
-			split_datapoints = (self.datapoints[self.datapoints[attribute] != threshold], self.datapoints[self.datapoints[attribute] == threshold])
-		return (DataSet(datapoints=split_datapoints[0]), DataSet(datapoints=split_datapoints[1]))
-
-	def init_data_from_csv(self, filename):
-		# Parses data from a csv spreadsheet
-		reader = csv.reader(open(filename, 'rU'))
-		# The first row should be the column titles/attributes
-		# The second row should be the types of the column's data ('int', 'float', 'boolean', 'text')
-		attributes = reader.next()
-		dtypes = [str(convert_str_to_np_type(elt)) for elt in reader.next()]
-		datatypes = [(attr, dtype) for attr, dtype in zip(attributes, dtypes)]
-		bool_indices = [i for i in range(len(dtypes)) if dtypes[i] == np.dtype(bool)]
-
-		def handle_booleans(elt):
-			for index in bool_indices:
-				elt[index] = elt[index].lower() == 'true' or elt[index].lower() == 'x' or elt[index].lower() == 'yes'
-			return elt
-
-		# Reads each row as a datapoint, with each column representing an attribute/label
-		data = [tuple(handle_booleans(elt)) for elt in list(reader)]
-		datapoints = np.array(data, dtype=datatypes)
-		return datapoints
+			vocabulary, codes = self.get_codes(attribute)
+			right = np.in1d(codes, encode_values(vocabulary, category_set(threshold)))
+		return (self.view(*self.select_rows(~right)), self.view(*self.select_rows(right)))
+
+	def init_data_from_csv(self, filename, n_jobs=1):
+		# Parses data from a csv spreadsheet into a structured array
+		return DataSet(store=read_csv_columns(filename, n_jobs=n_jobs)).datapoints
 
 	def get_attribute_datatype(self, attribute):
-		return self.datapoints.dtype[attribute]
+		return self.store.dtype(attribute)
 
 	def get_attributes(self):
-		return self.datapoints.dtype.names
+		return self.attributes
 
 	def get_column_vector(self, attribute):
-		return np.array(self.datapoints[attribute])
+		# copy of the column with weighted rows repeated
+		if self.weights is not None:
+			return np.repeat(self.get_column(attribute), self.weights)
+		return np.array(self.get_column(attribute))
 
-	# return number of points in dataset.datapoints
+	# return number of points in the dataset, counting weighted rows by their multiplicity
 	def __len__(self):
-		return self.datapoints.shape[0]
+		if self.weights is not None:
+			return int(self.weights.sum())
+		return self.count_rows()
+
+	def draw_sample(self, sample_size=None, replace=True, random_state=None):
+		# (positions, counts): the ascending positions of the view's rows drawn by a sample of sample_size rows and how
+		# often each was drawn, counts is None without replacement; weighted rows are drawn in proportion to their weight
+		# unweighted views are sampled in memory proportional to the sample, not the view
+		# sample_size defaults to the view's size, counting weights only with replacement
+		if sample_size is None:
+			sample_size = len(self) if replace else self.count_rows()
+		if random_state is None:
+			random_state = np.random
+		if self.weights is not None:
+			draws = random_state.choice(self.count_rows(), size=sample_size, replace=replace, p=self.weights / float(self.weights.sum()))
+		elif replace:
+			draws = random_state.randint(0, self.count_rows(), size=sample_size)
+		else:
+			return (sample_without_replacement(self.count_rows(), sample_size, random_state), None)
+		return np.unique(draws, return_counts=True) if replace else (np.sort(draws), None)
+
+	def select_sample(self, positions, counts=None):
+		# view of the rows at the given ascending positions weighted by counts (see draw_sample), no records are copied
+		# and a memory-mapped store is read in offset order
+		rows = positions if self.rows is None else self.rows[positions]
+		return self.view(rows=rows, weights=counts)
 
 	# selects a sample with replacement from the dataset
 	# if no sample size is given, the sample size will be the size of the entire dataset
-	def get_sample_with_replacement(self, dataset=None, sample_size=None):
+	# the sample is a view whose weights count how often each row was drawn, no records are copied
+	def get_sample_with_replacement(self, dataset=None, sample_size=None, random_state=None):
 		if not dataset:
 			dataset = self
-		if not sample_size:
-			sample_size = self.datapoints.shape[0]
-		datapoints = np.random.choice(self.datapoints, size=sample_size, replace=True)
-		return DataSet(datapoints=datapoints)
+		return self.select_sample(*self.draw_sample(sample_size, True, random_state))
 
 	def get_sorted_iterator(self, attribute=None):
 		# iterates through backwards
@@ -27,7 +27,238 @@ def information_gain(counts, left_counts, right_counts):
 		return 0
 	return entropy(counts, size=total_size) - (left_size/total_size) * entropy(left_counts, size=left_size) - (right_size/total_size) * entropy(right_counts, size=right_size)
 
-def find_optimal_split(dataset, label, attribute=None):
+def entropy_rows(counts, sizes):
+	# entropy of each row of a (rows x classes) count matrix
+	with np.errstate(divide='ignore', invalid='ignore'):
+		p = counts / sizes[:, np.newaxis]
+		terms = np.where(counts > 0, -p * np.log2(p), 0.0)
+	return terms.sum(axis=1)
+
+def split_gains(left_counts, total_counts):
+	# information gain of each candidate split given its (candidates x classes) left side counts
+	right_counts = total_counts - left_counts
+	left_sizes = left_counts.sum(axis=1)
+	total_size = total_counts.sum()
+	right_sizes = total_size - left_sizes
+
+	total_entropy = entropy_rows(total_counts[np.newaxis, :], np.array([total_size]))[0]
+	return total_entropy - (left_sizes/total_size) * entropy_rows(left_counts, left_sizes) - (right_sizes/total_size) * entropy_rows(right_counts, right_sizes)
+
+def target_statistics(targets, weights=None):
+	# (rows x 3) weight, weighted target and weighted squared target of every row of a numeric label
+	# summed over any group of rows they give its size, mean and variance
+	statistics = np.empty((targets.shape[0], 3))
+	statistics[:, 0] = 1 if weights is None else weights
+	statistics[:, 1] = statistics[:, 0] * targets
+	statistics[:, 2] = statistics[:, 1] * targets
+	return statistics
+
+def squared_errors(statistics):
+	# sum of squared deviations from the mean of each row of summed target statistics
+	with np.errstate(divide='ignore', invalid='ignore'):
+		errors = statistics[:, 2] - np.where(statistics[:, 0] > 0, statistics[:, 1]**2 / statistics[:, 0], 0.0)
+	return np.maximum(errors, 0)
+
+def variance_reductions(left_statistics, total_statistics):
+	# reduction of the weighted target variance of each candidate split given its (candidates x 3) left side statistics
+	right_statistics = total_statistics - left_statistics
+	total_error = squared_errors(total_statistics[np.newaxis, :])[0]
+	return (total_error - squared_errors(left_statistics) - squared_errors(right_statistics)) / total_statistics[0]
+
+def count_candidates(stats, count):
+	# instrumentation: stats is None or a dict counting the candidate splits scored
+	if stats is not None:
+		stats['candidates'] = stats.get('candidates', 0) + count
+
+def best_sorted_threshold(sorted_values, sorted_codes, n_classes, sorted_weights=None, stats=None, min_leaf=0):
+	# scores every threshold of an attribute column that is already sorted ascending
+	# sorted_weights optionally gives each row a multiplicity
+	# min_leaf only scores thresholds leaving at least that many (weighted) rows on each side
+	# if n_classes is None sorted_codes are numeric targets and splits are scored by variance reduction
+	# returns (index, gain) where sorted_values[index] is the best threshold, or (None, 0)
+	n = sorted_values.shape[0]
+	if n < 2:
+		return (None, 0)
+
+	# a threshold at position i splits the rows into [0, i) and [i, n)
+	candidates = np.nonzero(sorted_values[1:] != sorted_values[:-1])[0] + 1
+	if min_leaf:
+		sizes = np.cumsum(sorted_weights) if sorted_weights is not None else np.arange(1, n + 1)
+		left_sizes = sizes[candidates - 1]
+		candidates = candidates[(left_sizes >= min_leaf) & (sizes[-1] - left_sizes >= min_leaf)]
+	count_candidates(stats, candidates.shape[0])
+	if candidates.shape[0] == 0:
+		return (None, 0)
+
+	if n_classes is None:
+		cumulative = np.cumsum(target_statistics(sorted_codes, sorted_weights), axis=0)
+		gains = variance_reductions(cumulative[candidates - 1], cumulative[-1])
+	else:
+		onehot = np.zeros((n, n_classes))
+		onehot[np.arange(n), sorted_codes] = 1 if sorted_weights is None else sorted_weights
+		cumulative = np.cumsum(onehot, axis=0)
+		gains = split_gains(cumulative[candidates - 1], cumulative[-1])
+
+	# ties go to the largest threshold, matching a descending scan
+	best = gains.shape[0] - 1 - np.argmax(gains[::-1])
+	return (candidates[best], float(gains[best]))
+
+def category_counts(categories, codes, n_categories, n_classes, weights=None):
+	# (categories x classes) label counts of a column of category codes
+	# if n_classes is None codes are numeric targets and the (categories x 3) target statistics are summed instead
+	if n_classes is None:
+		statistics = target_statistics(codes, weights)
+		return np.column_stack([np.bincount(categories, weights=statistics[:, column], minlength=n_categories) for column in range(3)])
+	indices = categories.astype(np.intp) * n_classes + codes
+	return np.bincount(indices, weights=weights, minlength=n_categories * n_classes).reshape(n_categories, n_classes)
+
+def best_category_subset(counts, regression=False, stats=None, min_leaf=0):
+	# finds the best split of an attribute's categories into two groups from its (categories x classes) label counts,
+	# or from its (categories x 3) target statistics for regression
+	# min_leaf only scores splits leaving at least that many (weighted) rows in each group
+	# returns (subset, gain) where subset is a boolean mask of the categories sent right, or (None, 0)
+	counts = np.asarray(counts, dtype=float)
+	sizes = counts[:, 0] if regression else counts.sum(axis=1)
+	present = np.nonzero(sizes > 0)[0]
+	if present.shape[0] < 2:
+		return (None, 0)
+	present_counts = counts[present]
+	sizes = sizes[present]
+
+	# with two classes the best subset is a prefix of the categories ordered by their rate of one class,
+	# with more classes the ordering by each class's rate is tried; for regression the ordering by mean target is optimal
+	optimal_subset = None
+	optimal_gain = 0
+	for label in range(1 if regression or counts.shape[1] <= 2 else counts.shape[1]):
+		order = np.argsort(present_counts[:, 1 if regression else label] / sizes, kind='mergesort')
+		cumulative = np.cumsum(present_counts[order], axis=0)
+		count_candidates(stats, present.shape[0] - 1)
+		if regression:
+			gains = variance_reductions(cumulative[:-1], cumulative[-1])
+		else:
+			gains = split_gains(cumulative[:-1], cumulative[-1])
+		if min_leaf:
+			left_sizes = np.cumsum(sizes[order])[:-1]
+			gains[(left_sizes < min_leaf) | (sizes.sum() - left_sizes < min_leaf)] = 0
+		best = np.argmax(gains)
+		if gains[best] > optimal_gain:
+			optimal_subset = np.zeros(counts.shape[0], dtype=bool)
+			optimal_subset[present[order[best + 1:]]] = True
+			optimal_gain = float(gains[best])
+	return (optimal_subset, optimal_gain)
+
+def find_presorted_split(columns, codes, n_classes, sorted_indices, attributes, weights=None, categories=None, stats=None, min_leaf=0):
+	# columns maps attribute -> column vector, codes (and optional weights) belong to the same rows
+	# sorted_indices maps attribute -> row indices ordered by that attribute (may cover only a subset of rows)
+	# categories maps categorical attributes -> their number of categories, their columns hold category codes
+	# and need not be sorted; their threshold is the boolean mask of the categories sent right
+	# if n_classes is None codes are numeric targets and splits are scored by variance reduction
+	# stats optionally counts the candidate splits scored (see count_candidates)
+	# min_leaf is the least (weighted) number of rows either side of a split may get
+	optimal_threshold = None
+	optimal_attribute = None
+	optimal_gain = 0
+	if categories is None:
+		categories = {}
+
+	for attribute in attributes:
+		indices = sorted_indices[attribute]
+		sorted_weights = weights[indices] if weights is not None else None
+		if attribute in categories:
+			counts = category_counts(columns[attribute][indices], codes[indices], categories[attribute], n_classes, sorted_weights)
+			threshold, split_gain = best_category_subset(counts, n_classes is None, stats, min_leaf)
+		else:
+			sorted_values = columns[attribute][indices]
+			index, split_gain = best_sorted_threshold(sorted_values, codes[indices], n_classes, sorted_weights, stats, min_leaf)
+			threshold = sorted_values[index] if index is not None else None
+
+		if split_gain > optimal_gain:
+			optimal_threshold = threshold
+			optimal_attribute = attribute
+			optimal_gain = split_gain
+
+	return (optimal_threshold, optimal_attribute, optimal_gain)
+
+def find_histogram_split(histograms, attributes, categorical=(), regression=False, stats=None, min_leaf=0):
+	# histograms maps attribute -> (bins x classes) label counts of a node, or (bins x 3) target statistics for regression
+	# returns (bin, attribute, gain), splitting at bin b sends bins >= b right
+	# min_leaf is the least (weighted) number of rows either side of a split may get
+	# the bins of categorical attributes are categories, for them bin is the boolean mask of the bins sent right
+	optimal_bin = None
+	optimal_attribute = None
+	optimal_gain = 0
+
+	for attribute in attributes:
+		if attribute in categorical:
+			subset, split_gain = best_category_subset(histograms[attribute], regression, stats, min_leaf)
+			if split_gain > optimal_gain:
+				optimal_bin = subset
+				optimal_attribute = attribute
+				optimal_gain = split_gain
+			continue
+
+		cumulative = np.cumsum(histograms[attribute], axis=0, dtype=float)
+		sizes = cumulative[:, 0] if regression else cumulative.sum(axis=1)
+		total_size = sizes[-1]
+		# a split at bin b needs rows on both sides, at least min_leaf of them
+		left_sizes = sizes[:-1]
+		candidates = np.nonzero((left_sizes > 0) & (left_sizes < total_size) & (left_sizes >= min_leaf) & (total_size - left_sizes >= min_leaf))[0] + 1
+		count_candidates(stats, candidates.shape[0])
+		if candidates.shape[0] == 0:
+			continue
+		if regression:
+			gains = variance_reductions(cumulative[candidates - 1], cumulative[-1])
+		else:
+			gains = split_gains(cumulative[candidates - 1], cumulative[-1])
+
+		best = gains.shape[0] - 1 - np.argmax(gains[::-1])
+		if gains[best] > optimal_gain:
+			optimal_bin = candidates[best]
+			optimal_attribute = attribute
+			optimal_gain = float(gains[best])
+
+	return (optimal_bin, optimal_attribute, optimal_gain)
+
+def find_optimal_split(dataset, label, attribute=None, regression=False):
+	# if attribute is not given, all attributes will be searched
+	# scores every candidate threshold of an attribute at once from cumulative class counts,
+	# or by variance reduction of a numeric label from cumulative sums and sums of squares for regression
+	attributes = [attribute] # if we already know what attribute to split on
+	if not attribute:
+		attributes = dataset.get_attributes()
+	# don't use the label as a splitting attribute
+	attributes = [attribute for attribute in attributes if attribute != label]
+
+	# non-numeric attributes are split into two groups of categories counted from their codes,
+	# the threshold of such a split is the array of categories sent right
+	if regression:
+		# centering the targets keeps the sums of squares accurate
+		codes = dataset.get_column(label).astype(float)
+		codes -= codes.mean() if codes.shape[0] else 0
+		n_classes = None
+	else:
+		classes, codes = dataset.get_codes(label)
+		n_classes = classes.shape[0]
+	columns = {}
+	vocabularies = {}
+	categories = {}
+	sorted_indices = {}
+	for attribute in attributes:
+		if data.is_numeric(dataset.get_attribute_datatype(attribute)):
+			columns[attribute] = dataset.get_column(attribute)
+			sorted_indices[attribute] = np.argsort(columns[attribute], kind='mergesort')
+		else:
+			vocabularies[attribute], columns[attribute] = dataset.get_codes(attribute)
+			categories[attribute] = vocabularies[attribute].shape[0]
+			sorted_indices[attribute] = np.arange(columns[attribute].shape[0])
+
+	threshold, attribute, gain = find_presorted_split(columns, codes, n_classes, sorted_indices, attributes, dataset.get_weights(), categories)
+	if attribute in vocabularies:
+		threshold = vocabularies[attribute][threshold]
+	return (threshold, attribute, gain)
+
+def find_optimal_split_iterator(dataset, label, attribute=None):
+	# reference implementation: walks a SortedIterator one record at a time
 	# if attribute is not given, all attributes will be searched
 	counts = dataset.count_labels(label)
 	attributes = [attribute] # if we already know what attribute to split on
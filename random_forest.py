@@ -1,10 +1,18 @@
 import data
 import objectives
 
+import csv
+import heapq
+import itertools
 import math
+import multiprocessing
 import numpy as np
 from numpy.lib.recfunctions import append_fields
+import os
 import random
+import shutil
+import tempfile
+import time
 
 '''
 For usage example tests/testcases/test_randomforest.py
@@ -20,30 +28,145 @@ def prediction(probabilities, label_type):
 
 	return np.rec.array((best_label, best_probability), dtype=[('_prediction', label_type), ('_probability', np.dtype(float))])
 
+def grow_tree(dataset, seed, classes, options, columns=None):
+	# the seed fixes both the bootstrap sample and the feature projections of one tree
+	# options are the keyword arguments of Tree, only the flattened tree is kept
+	# given the encoded training columns (see encode_dataset) the tree also predicts the rows its sample left out,
+	# returning (tree, out of bag row positions, their predictions)
+	# a true options['stats'] records the tree's growth in a GrowthStats of its own, kept as the tree's stats
+	# options['sample_size'] and options['replace'] set the size of the sample and whether it is drawn with replacement,
+	# by default a bootstrap sample the size of the dataset
+	options = dict(options)
+	stats = GrowthStats() if options.pop('stats', False) else None
+	sample_size, replace = options.pop('sample_size', None), options.pop('replace', True)
+	start = time.time() if stats is not None else None
+	positions, counts = dataset.draw_sample(sample_size, replace, np.random.RandomState(seed))
+	sample = dataset.select_sample(positions, counts)
+	sample_seconds = time.time() - start if stats is not None else None
+	tree = Tree(sample, seed=seed, stats=stats, **options).flatten(classes)
+	if stats is not None:
+		stats.add_time(0, None, 'sample', sample_seconds)
+		tree.stats = stats
+	if columns is None:
+		return tree
+
+	start = time.time() if stats is not None else None
+	in_bag = np.zeros(dataset.count_rows(), dtype=bool)
+	in_bag[positions] = True
+	out_of_bag = np.nonzero(~in_bag)[0]
+	if options.get('regression'):
+		scores = tree.predict_batch_values(None, columns, out_of_bag)
+	else:
+		scores = tree.predict_batch_probabilities(None, columns, out_of_bag)
+	if stats is not None:
+		stats.add_time(0, None, 'out of bag', time.time() - start)
+	return (tree, out_of_bag, scores)
+
+def encode_dataset(dataset, attributes):
+	# columns of a training dataset the way trees compare them, non-numeric attributes as codes
+	return dict((attribute, dataset.get_column(attribute) if data.is_numeric(dataset.get_attribute_datatype(attribute)) else dataset.get_codes(attribute)[1]) for attribute in attributes)
+
+# training data and settings shared by every tree grown in a worker process
+_worker = {}
+
+def _init_worker(directory, rows, weights, attributes, classes, options, oob):
+	store = data.ColumnStore.load(directory)
+	dataset = data.DataSet(store=store, rows=rows, weights=weights, attributes=attributes)
+	columns = encode_dataset(dataset, [attribute for attribute in attributes if attribute != options['label']]) if oob else None
+	_worker['dataset'] = dataset
+	_worker['arguments'] = (classes, options, columns)
+
+def _grow_tree(seed):
+	return grow_tree(_worker['dataset'], seed, *_worker['arguments'])
+
+class GrowthStats():
+	# optional instrumentation of tree growth, pass one to Tree or RandomForest.grow
+	# counts are kept per tree and depth: nodes reached, leaves made, rows of those nodes, candidate splits scored
+	# and bytes of row indices and histograms allocated for children
+	# seconds are kept per tree, depth and phase; depth is None for per-tree phases (sample, sort, bin, out of bag)
+
+	COUNTS = ('nodes', 'leaves', 'rows', 'candidates', 'bytes')
+
+	def __init__(self):
+		self.trees = 0
+		self.counts = {}
+		self.seconds = {}
+
+	def add_tree(self):
+		# index of a new tree
+		self.trees += 1
+		return self.trees - 1
+
+	def count(self, tree, depth):
+		# the counts of one depth of a tree
+		if (tree, depth) not in self.counts:
+			self.counts[(tree, depth)] = dict((name, 0) for name in self.COUNTS)
+		return self.counts[(tree, depth)]
+
+	def add_time(self, tree, depth, phase, seconds):
+		self.seconds[(tree, depth, phase)] = self.seconds.get((tree, depth, phase), 0.0) + seconds
+
+	def merge(self, other):
+		# appends the trees of another GrowthStats, e.g. one filled in a worker process
+		for (tree, depth), counts in other.counts.items():
+			self.counts[(tree + self.trees, depth)] = dict(counts)
+		for (tree, depth, phase), seconds in other.seconds.items():
+			self.add_time(tree + self.trees, depth, phase, seconds)
+		self.trees += other.trees
+
+	def by_depth(self):
+		# counts and seconds per phase summed over the trees, keyed by depth
+		totals = {}
+		for (tree, depth), counts in self.counts.items():
+			total = totals.setdefault(depth, {})
+			for name, count in counts.items():
+				total[name] = total.get(name, 0) + count
+		for (tree, depth, phase), seconds in self.seconds.items():
+			total = totals.setdefault(depth, {})
+			total[phase] = total.get(phase, 0.0) + seconds
+		return totals
+
+	def folded(self):
+		# flame graph input in the folded stack format, one "forest;tree;depth;phase microseconds" line per phase
+		lines = []
+		for (tree, depth, phase), seconds in sorted(self.seconds.items(), key=lambda item: (item[0][0], -1 if item[0][1] is None else item[0][1], item[0][2])):
+			frames = ['forest', 'tree %d' % tree] + (['depth %d' % depth] if depth is not None else []) + [phase]
+			lines.append('%s %d' % (';'.join(frames), int(round(seconds * 1e6))))
+		return lines
+
+	def write_folded(self, filename):
+		with open(filename, 'w') as folded_file:
+			folded_file.write('\n'.join(self.folded()) + '\n')
+
 class Node():
 
+	# only the root of a growing tree holds its dataset, nodes keep whether their attribute is numeric once split
 	def __init__(self, dataset, label):
 		self.dataset = dataset
 		self.label = label
 		self.left_node = None
 		self.right_node = None
+		self.mean = None
+		self.numeric = None
 
 	def is_leaf(self):
 		return not self.left_node and not self.right_node
 
 	def predict(self, datapoint):
 		if self.is_leaf():
-			return self.probabilities
+			# leaves of regression trees predict their mean target
+			return self.probabilities if self.mean is None else self.mean
 		else:
 			next_node = None
-			if data.is_numeric(self.dataset.get_attribute_datatype(self.attribute)):
+			if self.numeric:
 				next_node = self.left_node if datapoint[self.attribute] < self.threshold else self.right_node
 			else:
-				next_node = self.left_node if datapoint[self.attribute] != self.threshold else self.right_node
+				next_node = self.right_node if datapoint[self.attribute] in data.category_set(self.threshold) else self.left_node
 			return next_node.predict(datapoint)
 
-	def set_leaf_probabilities(self):
-		label_counts = self.dataset.count_labels(self.label)
+	def set_leaf_probabilities(self, label_counts=None):
+		if label_counts is None:
+			label_counts = self.dataset.count_labels(self.label)
 		total = float(objectives.sum_values(label_counts))
 		for label in label_counts.keys():
 			label_counts[label] = label_counts[label]/total
@@ -51,74 +174,753 @@ class Node():
 
 class Tree():
 
-	def __init__(self, root_dataset, max_depth, label, m):
+	# n_bins switches from exact split search to histogram split search over quantile-binned columns
+	# regression grows a regression tree on a numeric label, splitting by variance reduction
+	# stats optionally is a GrowthStats the tree records its growth in
+	# level_wise grows a histogram tree breadth-first, one depth at a time (see grow_levels)
+	# nodes with fewer than min_samples_split rows, or pure ones, are leaves; splits leave at least min_samples_leaf rows
+	# on either side and gain at least min_gain; rows are counted with their weights, e.g. bootstrap draws
+	# max_leaf_nodes grows the tree best-first up to that many leaves (see grow_best_first)
+	def __init__(self, root_dataset, max_depth, label, m, seed=None, n_bins=None, regression=False, stats=None, level_wise=False,
+			min_samples_split=2, min_samples_leaf=1, min_gain=0.0, max_leaf_nodes=None):
+		if level_wise and not n_bins:
+			raise ValueError('Level-wise growth needs histograms, give n_bins.')
+		if level_wise and max_leaf_nodes:
+			raise ValueError('Level-wise growth can not limit the number of leaves.')
 		self.label = label
 		self.m = m
+		self.max_depth = max_depth
+		self.min_samples_split = min_samples_split
+		self.min_samples_leaf = min_samples_leaf
+		self.min_gain = min_gain
+		self.max_leaf_nodes = max_leaf_nodes
+		self.stats = stats
+		self.stats_tree = stats.add_tree() if stats is not None else None
+		self.n_bins = n_bins
+		self.regression = regression
+		self.random = random.Random(seed) if seed is not None else random
+		self.attributes = [attribute for attribute in root_dataset.get_attributes() if attribute != label]
+		if regression:
+			# regression trees have no classes, codes holds the targets centered on their mean
+			targets = root_dataset.get_column(label).astype(float)
+			self.offset = targets.mean() if targets.shape[0] else 0.0
+			self.classes, self.codes, self.n_classes = None, targets - self.offset, None
+		else:
+			self.classes, self.codes = root_dataset.get_codes(label)
+			self.n_classes = self.classes.shape[0]
+		# non-numeric attributes are split into two groups of categories and compared by their codes
+		self.vocabularies = dict((attribute, root_dataset.get_vocabulary(attribute)) for attribute in self.attributes if not data.is_numeric(root_dataset.get_attribute_datatype(attribute)))
+		self.categories = dict((attribute, vocabulary.shape[0]) for attribute, vocabulary in self.vocabularies.items())
+		self.numeric = [attribute not in self.vocabularies for attribute in self.attributes]
+		self.weights = root_dataset.get_weights()
+		self.goes_right = np.zeros(root_dataset.count_rows(), dtype=bool)
 		self.root = Node(root_dataset, self.label)
-		self.grow(max_depth, self.root)
-			
+
+		start = time.time() if stats is not None else None
+		if n_bins:
+			# columns are binned once per dataset, nodes carry their rows and per-attribute class histograms
+			self.bins, self.bin_values = {}, {}
+			for attribute in self.attributes:
+				self.bin_values[attribute], self.bins[attribute] = root_dataset.get_bins(attribute, n_bins)
+			self.root.rows = np.arange(root_dataset.count_rows())
+			self.root.histograms = self.histograms(self.root.rows)
+		else:
+			# every numeric attribute is sorted once per tree, nodes carry their rows in each attribute's order
+			# categorical attributes are counted per category and don't need sorting
+			self.columns = {}
+			self.root.sorted_indices = {}
+			for attribute in self.attributes:
+				if attribute in self.vocabularies:
+					self.columns[attribute] = root_dataset.get_codes(attribute)[1]
+					self.root.sorted_indices[attribute] = np.arange(self.columns[attribute].shape[0])
+				else:
+					self.columns[attribute] = root_dataset.get_column(attribute)
+					self.root.sorted_indices[attribute] = np.argsort(self.columns[attribute], kind='mergesort')
+		if stats is not None:
+			stats.add_time(self.stats_tree, None, 'bin' if n_bins else 'sort', time.time() - start)
+
+		if max_leaf_nodes:
+			self.grow_best_first()
+		elif level_wise:
+			self.grow_levels()
+		else:
+			self.grow(max_depth, self.root)
+		self.flat = None
+
+		# the training data, presorted columns and bins are only needed while growing
+		self.root.dataset = None
+		self.columns = None
+		self.bins = None
+		self.codes = None
+		self.weights = None
+		self.goes_right = None
+		self.random = None
+
 	def grow(self, depth_remaining, node):
-		if depth_remaining == 0:
-			node.set_leaf_probabilities()
+		depth = self.max_depth - depth_remaining
+		split = self.split(node, depth)
+		if split is None:
 			return
+		self.divide(node, split, depth)
+		self.grow(depth_remaining - 1, node.left_node)
+		self.grow(depth_remaining - 1, node.right_node)
+
+	def grow_best_first(self):
+		# splits the node of largest gain first, whatever its depth, until the tree has max_leaf_nodes leaves
+		# candidates is a heap of (-gain, order found, node, depth, split, attribute)
+		candidates, order = [], itertools.count()
+		self.push_split(candidates, order, self.root, 0)
+		leaves = 1
+		while candidates:
+			_, _, node, depth, split, attribute = heapq.heappop(candidates)
+			if leaves >= self.max_leaf_nodes:
+				self.set_leaf(node, depth)
+				continue
+			self.set_split(node, split, attribute)
+			self.divide(node, split, depth)
+			leaves += 1
+			self.push_split(candidates, order, node.left_node, depth + 1)
+			self.push_split(candidates, order, node.right_node, depth + 1)
 
-		datasubset = node.dataset.get_random_feature_projection(self.label, self.m)
-		threshold, attribute, gain = objectives.find_optimal_split(datasubset, self.label)
-		if gain == 0:
-			node.set_leaf_probabilities()
+	def push_split(self, candidates, order, node, depth):
+		found = self.find_split(node, depth)
+		if found is None:
+			self.set_leaf(node, depth)
 			return
+		split, attribute, gain = found
+		heapq.heappush(candidates, (-gain, next(order), node, depth, split, attribute))
 
-		node.threshold = threshold
+	def split(self, node, depth):
+		# picks the split of a node and gives it two empty children, returning the split in the attribute's encoding
+		# (threshold, bin or mask of categories sent right), or makes the node a leaf and returns None
+		found = self.find_split(node, depth)
+		if found is None:
+			self.set_leaf(node, depth)
+			return None
+		return self.set_split(node, found[0], found[1])
+
+	def find_split(self, node, depth):
+		# (split, attribute, gain) of the best split of a node, or None if it should be a leaf
+		# with stats every node is counted at its depth, instrumentation costs one check per step without
+		counts = self.stats.count(self.stats_tree, depth) if self.stats is not None else None
+		rows = self.node_rows(node)
+		if counts is not None:
+			counts['nodes'] += 1
+			counts['rows'] += rows.shape[0]
+		if depth == self.max_depth:
+			return None
+		# small and pure nodes are leaves without searching
+		size = rows.shape[0] if self.weights is None else self.weights[rows].sum()
+		if rows.shape[0] < 2 or size < self.min_samples_split or size < 2 * self.min_samples_leaf:
+			return None
+		codes = self.codes[rows]
+		if codes.min() == codes.max():
+			return None
+
+		attributes = self.random.sample(self.attributes, min(self.m, len(self.attributes)))
+		start = time.time() if counts is not None else None
+		if self.n_bins:
+			split, attribute, gain = objectives.find_histogram_split(node.histograms, attributes, self.categories, self.regression, counts, self.min_samples_leaf)
+		else:
+			split, attribute, gain = objectives.find_presorted_split(self.columns, self.codes, self.n_classes, node.sorted_indices, attributes, self.weights, self.categories, counts, self.min_samples_leaf)
+		if counts is not None:
+			self.stats.add_time(self.stats_tree, depth, 'score', time.time() - start)
+		if gain == 0 or gain < self.min_gain:
+			return None
+		return (split, attribute, gain)
+
+	def set_split(self, node, split, attribute):
+		# categorical nodes keep the array of categories sent right as their threshold
 		node.attribute = attribute
+		node.numeric = attribute not in self.vocabularies
+		node.left_node, node.right_node = Node(None, self.label), Node(None, self.label)
+		if self.n_bins:
+			node.threshold = self.bin_values[attribute][split]
+		else:
+			node.threshold = self.vocabularies[attribute][split] if attribute in self.vocabularies else split
+		return split
 
-		left_data, right_data = datasubset.split_data(attribute, threshold)
+	def divide(self, node, split, depth):
+		# hands the rows of a split node, and their histograms, to its children
+		start = time.time() if self.stats is not None else None
+		if self.n_bins:
+			self.split_histograms(node, node.attribute, split)
+		else:
+			node.left_node.sorted_indices, node.right_node.sorted_indices = self.partition(node.sorted_indices, node.attribute, split)
+			node.sorted_indices = None
+		if self.stats is not None:
+			self.stats.add_time(self.stats_tree, depth, 'split', time.time() - start)
+			self.stats.count(self.stats_tree, depth)['bytes'] += self.node_bytes(node.left_node) + self.node_bytes(node.right_node)
 
-		node.left_node, node.right_node = Node(left_data, self.label), Node(right_data, self.label)
+	def goes_right_of(self, rows, attribute, split):
+		# whether each of the rows goes right of a split returned by split
+		values = (self.bins if self.n_bins else self.columns)[attribute][rows]
+		return split[values] if attribute in self.categories else values >= split
 
-		self.grow(depth_remaining - 1, node.left_node)
-		self.grow(depth_remaining - 1, node.right_node)
+	def partition(self, sorted_indices, attribute, threshold):
+		# stable partition of every attribute's index array keeps the children sorted without re-sorting
+		# threshold is the boolean mask of the categories sent right for categorical attributes
+		rows = sorted_indices[attribute]
+		self.goes_right[rows] = self.goes_right_of(rows, attribute, threshold)
+
+		left_indices, right_indices = {}, {}
+		for attribute, indices in sorted_indices.items():
+			mask = self.goes_right[indices]
+			left_indices[attribute] = indices[~mask]
+			right_indices[attribute] = indices[mask]
+		return (left_indices, right_indices)
+
+	def grow_levels(self):
+		# breadth-first histogram growth that passes over the rows once per attribute and depth rather than once per node:
+		# the rows of the nodes of a depth are contiguous slices of a single row array, regrouped by child after the
+		# whole depth is split, and the histograms of the next depth are counted in one pass (see level_histograms)
+		rows = self.root.rows
+		frontier = [self.root]
+		for depth in range(self.max_depth + 1):
+			# slots holds the position among the next depth's nodes of every row, -1 for rows of new leaves
+			slots = np.full(self.goes_right.shape[0], -1, dtype=np.intp)
+			parents, children = [], []
+			for node in frontier:
+				split = self.split(node, depth)
+				if split is None:
+					continue
+				node_rows = self.node_rows(node)
+				slots[node_rows] = len(children) + self.goes_right_of(node_rows, node.attribute, split)
+				parents.append(node)
+				children += [node.left_node, node.right_node]
+			if not children:
+				break
+
+			start = time.time() if self.stats is not None else None
+			sizes = np.bincount(slots[slots >= 0], minlength=len(children))
+			rows = self.regroup(rows, slots, sizes)
+			bounds = np.concatenate([[0], np.cumsum(sizes)])
+			for slot, child in enumerate(children):
+				child.rows = rows[bounds[slot]:bounds[slot + 1]]
+			self.level_histograms(parents, children, slots)
+			for node in parents:
+				node.rows = None
+				node.histograms = None
+			if self.stats is not None:
+				self.stats.add_time(self.stats_tree, depth, 'split', time.time() - start)
+				self.stats.count(self.stats_tree, depth)['bytes'] += sum(self.node_bytes(child) for child in children)
+			frontier = children
+
+	def regroup(self, indices, slots, sizes):
+		# stable counting sort of indices grouped by split node into indices grouped by child, children 2 * i and
+		# 2 * i + 1 being the i-th split node's, given each child's size; rows of new leaves (slot -1) are dropped
+		indices = indices[slots[indices] >= 0]
+		children = slots[indices]
+		right = children & 1
+		# a row's rank within its child is the number of rows going the same way before it, less those of earlier nodes
+		rights_before = np.cumsum(right) - right
+		lefts_before = np.arange(indices.shape[0]) - rights_before
+		lefts_earlier = np.cumsum(sizes[0::2]) - sizes[0::2]
+		rights_earlier = np.cumsum(sizes[1::2]) - sizes[1::2]
+		ranks = np.where(right, rights_before - rights_earlier[children >> 1], lefts_before - lefts_earlier[children >> 1])
+		regrouped = np.empty_like(indices)
+		regrouped[np.cumsum(sizes)[children] - sizes[children] + ranks] = indices
+		return regrouped
+
+	def level_histograms(self, parents, children, slots):
+		# histograms of the children of one depth, children[2 * i] and children[2 * i + 1] being parents[i]'s:
+		# the smaller child of every pair is counted, in a single pass per attribute over all their rows,
+		# and its sibling's histograms are the parent's minus the smaller child's
+		small = [2 * i + int(children[2 * i].rows.shape[0] > children[2 * i + 1].rows.shape[0]) for i in range(len(parents))]
+		positions = np.full(len(children), -1, dtype=np.intp)
+		positions[small] = np.arange(len(small))
+		rows = np.concatenate([children[slot].rows for slot in small])
+		nodes = positions[slots[rows]]
+		codes = self.codes[rows]
+		weights = self.weights[rows] if self.weights is not None else None
+		for child in children:
+			child.histograms = {}
+		for attribute in self.attributes:
+			n_bins = self.bin_values[attribute].shape[0]
+			counts = objectives.category_counts(nodes * n_bins + self.bins[attribute][rows], codes, len(small) * n_bins, self.n_classes, weights).reshape(len(small), n_bins, -1)
+			for position, slot in enumerate(small):
+				children[slot].histograms[attribute] = counts[position]
+				children[slot ^ 1].histograms[attribute] = parents[slot // 2].histograms[attribute] - counts[position]
+
+	def histograms(self, rows):
+		# (bins x classes) label counts, or (bins x 3) target statistics, of the given rows for every attribute
+		codes = self.codes[rows]
+		weights = self.weights[rows] if self.weights is not None else None
+		histograms = {}
+		for attribute in self.attributes:
+			n_bins = self.bin_values[attribute].shape[0]
+			histograms[attribute] = objectives.category_counts(self.bins[attribute][rows], codes, n_bins, self.n_classes, weights)
+		return histograms
+
+	def split_histograms(self, node, attribute, split_bin):
+		# only the smaller child is counted, its sibling's histograms are the parent's minus the smaller child's
+		left, right = node.left_node, node.right_node
+		goes_right = self.goes_right_of(node.rows, attribute, split_bin)
+		left.rows, right.rows = node.rows[~goes_right], node.rows[goes_right]
+
+		small, large = (left, right) if left.rows.shape[0] <= right.rows.shape[0] else (right, left)
+		small.histograms = self.histograms(small.rows)
+		large.histograms = dict((attribute, node.histograms[attribute] - small.histograms[attribute]) for attribute in self.attributes)
+		node.rows = None
+		node.histograms = None
+
+	def node_rows(self, node):
+		# row positions of a node that is still growing
+		if self.n_bins:
+			return node.rows
+		return node.sorted_indices[self.attributes[0]] if self.attributes else np.arange(self.codes.shape[0])
+
+	def node_bytes(self, node):
+		# bytes of the row indices and histograms allocated for a node that is still growing
+		if self.n_bins:
+			return node.rows.nbytes + sum(histogram.nbytes for histogram in node.histograms.values())
+		return sum(indices.nbytes for indices in node.sorted_indices.values())
+
+	def set_leaf(self, node, depth=None):
+		start = time.time() if self.stats is not None else None
+		rows = self.node_rows(node)
+		weights = self.weights[rows] if self.weights is not None else None
+		if self.regression:
+			size, total = objectives.target_statistics(self.codes[rows], weights).sum(axis=0)[:2]
+			node.mean = self.offset + (total / size if size > 0 else 0.0)
+		else:
+			counts = np.bincount(self.codes[rows], weights=weights, minlength=self.n_classes)
+			node.set_leaf_probabilities(dict((self.classes[i], int(counts[i])) for i in np.nonzero(counts)[0]))
+		node.sorted_indices = None
+		node.rows = None
+		node.histograms = None
+		if self.stats is not None:
+			self.stats.count(self.stats_tree, depth)['leaves'] += 1
+			self.stats.add_time(self.stats_tree, depth, 'leaf', time.time() - start)
+
+	def flatten(self, classes=None):
+		# classes fixes the column order of the leaf probabilities, defaults to this tree's labels
+		# (None for regression trees)
+		if classes is None:
+			classes = self.classes
+		return FlatTree(self.root, self.attributes, self.numeric, classes, self.vocabularies)
+
+	def get_probabilities(self, datapoint):
+		if self.flat is None:
+			self.flat = self.flatten()
+		return self.flat.get_probabilities(datapoint)
+
+def encode_datapoints(datapoints, vocabularies):
+	# columns of a structured array, dictionary-encoded attributes are replaced by their codes
+	return dict((name, data.encode_values(vocabularies[name], datapoints[name]) if name in vocabularies else datapoints[name]) for name in datapoints.dtype.names)
+
+class FlatTree():
+	# a grown tree stored as parallel arrays indexed by node id, the root is node 0
+	# feature is -1 for leaves; numeric nodes send datapoint[attribute] < threshold left,
+	# categorical nodes send the codes c of their attribute with membership[subset + c] right,
+	# unknown categories go left
+	# value holds the class probabilities of each leaf, or a single column of leaf means if classes is None
+
+	ARRAYS = ('feature', 'threshold', 'left', 'right', 'subset', 'value', 'membership')
+
+	# arrays optionally maps the names in ARRAYS to the arrays of an already flattened tree, root is then ignored
+	def __init__(self, root, attributes, numeric, classes, vocabularies=None, arrays=None):
+		self.attributes = tuple(attributes)
+		self.numeric = np.array(numeric, dtype=bool)
+		self.classes = classes
+		self.vocabularies = vocabularies if vocabularies is not None else {}
+		if arrays is not None:
+			for name in self.ARRAYS:
+				setattr(self, name, arrays[name])
+			return
+		class_index = dict((label, index) for index, label in enumerate(classes if classes is not None else []))
+		feature_index = dict((attribute, index) for index, attribute in enumerate(attributes))
+
+		nodes = []
+		stack = [root]
+		while stack:
+			node = stack.pop()
+			nodes.append(node)
+			if not node.is_leaf():
+				stack.append(node.right_node)
+				stack.append(node.left_node)
+		node_ids = dict((id(node), index) for index, node in enumerate(nodes))
+
+		self.feature = np.full(len(nodes), -1, dtype=np.int32)
+		self.threshold = np.zeros(len(nodes))
+		self.left = np.full(len(nodes), -1, dtype=np.int32)
+		self.right = np.full(len(nodes), -1, dtype=np.int32)
+		self.subset = np.full(len(nodes), -1, dtype=np.int32)
+		self.value = np.zeros((len(nodes), len(classes) if classes is not None else 1))
+
+		membership = []
+		offset = 0
+		for index, node in enumerate(nodes):
+			if node.is_leaf():
+				if node.mean is not None:
+					self.value[index, 0] = node.mean
+					continue
+				for label, probability in node.probabilities.items():
+					self.value[index, class_index[label]] = probability
+				continue
+			self.feature[index] = feature_index[node.attribute]
+			self.left[index] = node_ids[id(node.left_node)]
+			self.right[index] = node_ids[id(node.right_node)]
+			if node.attribute in self.vocabularies:
+				vocabulary = self.vocabularies[node.attribute]
+				codes = data.encode_values(vocabulary, data.category_set(node.threshold))
+				mask = np.zeros(vocabulary.shape[0], dtype=bool)
+				mask[codes[codes >= 0]] = True
+				membership.append(mask)
+				self.subset[index] = offset
+				offset += mask.shape[0]
+			else:
+				self.threshold[index] = node.threshold
+		self.membership = np.concatenate(membership) if membership else np.zeros(0, dtype=bool)
+
+	def __getstate__(self):
+		# vocabularies belong to the training data and are shared by the forest, they aren't pickled per tree
+		state = self.__dict__.copy()
+		state['vocabularies'] = None
+		return state
+
+	def __len__(self):
+		return self.feature.shape[0]
+
+	def find_leaf(self, datapoint):
+		node = 0
+		while self.feature[node] >= 0:
+			feature = self.feature[node]
+			attribute = self.attributes[feature]
+			value = datapoint[attribute]
+			if self.numeric[feature]:
+				go_left = value < self.threshold[node]
+			else:
+				code = data.encode_values(self.vocabularies[attribute], [value])[0]
+				go_left = code < 0 or not self.membership[self.subset[node] + code]
+			node = self.left[node] if go_left else self.right[node]
+		return node
+
+	def apply(self, datapoints, columns=None, rows=None):
+		# leaf node id of every datapoint; all rows still inside the tree descend one level per pass
+		# columns optionally holds the already encoded columns of datapoints (see encode_datapoints),
+		# rows optionally restricts the prediction to those positions of the columns
+		if columns is None:
+			columns = encode_datapoints(datapoints, self.vocabularies)
+		nodes = np.zeros(rows.shape[0] if rows is not None else datapoints.shape[0], dtype=np.int32)
+		active = np.arange(nodes.shape[0])
+		while active.shape[0]:
+			current = nodes[active]
+			features = self.feature[current]
+			internal = features >= 0
+			active, current, features = active[internal], current[internal], features[internal]
+
+			go_left = np.empty(active.shape[0], dtype=bool)
+			for feature in np.unique(features):
+				selected = features == feature
+				positions = active[selected] if rows is None else rows[active[selected]]
+				values = columns[self.attributes[feature]][positions]
+				if self.numeric[feature]:
+					go_left[selected] = values < self.threshold[current[selected]]
+				else:
+					known = values >= 0
+					go_right = np.zeros(values.shape[0], dtype=bool)
+					go_right[known] = self.membership[self.subset[current[selected]][known] + values[known]]
+					go_left[selected] = ~go_right
+			nodes[active] = np.where(go_left, self.left[current], self.right[current])
+		return nodes
+
+	def predict_probabilities(self, datapoint):
+		# class probabilities in the order of self.classes
+		return self.value[self.find_leaf(datapoint)]
+
+	def predict_batch_probabilities(self, datapoints, columns=None, rows=None):
+		# (rows x classes) matrix of class probabilities
+		return self.value[self.apply(datapoints, columns, rows)]
+
+	def predict_value(self, datapoint):
+		# mean target of a regression tree's leaf
+		return self.value[self.find_leaf(datapoint), 0]
+
+	def predict_batch_values(self, datapoints, columns=None, rows=None):
+		return self.value[self.apply(datapoints, columns, rows), 0]
 
 	def get_probabilities(self, datapoint):
-		return self.root.predict(datapoint)
+		probabilities = self.predict_probabilities(datapoint)
+		return dict((self.classes[index], probabilities[index]) for index in np.nonzero(probabilities)[0])
 
 class RandomForest():
 
-	def __init__(self, dataset, label):
+	SCHEMA_FILENAME = 'forest.csv'
+
+	# regression grows regression trees on a numeric label and predicts the mean of their leaf means
+	def __init__(self, dataset, label, regression=False):
 		self.dataset = dataset
 		self.label = label
+		self.regression = regression
+		self.forest = []
+		self.clear_out_of_bag()
+		# temporary directory the dataset's store is saved to for parallel growth, see grow_parallel
+		self.store_directory = None
+
+	def __del__(self):
+		if getattr(self, 'store_directory', None) is not None:
+			shutil.rmtree(self.store_directory, ignore_errors=True)
 
-	def grow(self, max_depth=1, size=1, m=None):
+	def grow(self, max_depth=1, size=1, m=None, n_jobs=1, seed=None, n_bins=None, oob=False, warm_start=False, stats=None, level_wise=False,
+			min_samples_split=2, min_samples_leaf=1, min_gain=0.0, max_leaf_nodes=None, max_samples=None, replace=True):
+		# trees are grown in n_jobs processes (all cores if n_jobs is None or < 1)
+		# every tree gets its own seed, so a given seed grows the same forest for any n_jobs
+		# n_bins grows the trees from histograms of quantile-binned columns instead of exact splits
+		# level_wise grows histogram trees (n_bins is needed) breadth-first, see Tree.grow_levels
+		# min_samples_split, min_samples_leaf, min_gain and max_leaf_nodes stop each tree's growth early, see Tree
+		# max_samples is the number of rows, or the fraction (a float up to 1.0) of the dataset, each tree is grown on,
+		# drawn with replacement unless replace is False (then counting the view's distinct rows, not their weights);
+		# trees read their sample's rows in ascending order and otherwise only the store's vocabularies (one streamed
+		# pass per non-numeric column) and bin values (from a bounded sample), so a dataset memory-mapped from disk (see cache_dir in DataSet) needn't fit in memory, unless oob encodes it whole
+		# oob has every tree predict the training rows its bootstrap sample left out as it is grown,
+		# see set_out_of_bag for the resulting estimates
+		# warm_start keeps the existing trees and only grows the ones missing to reach size,
+		# their seeds continue the first grow's sequence so the forest matches one grown at once
+		# stats optionally is a GrowthStats every new tree's growth is added to, in the forest's tree order
 		if not m:
 			m = int(math.sqrt(len(self.dataset.get_attributes())))
+		rows = len(self.dataset) if replace else self.dataset.count_rows()
+		if max_samples is None:
+			sample_size = None
+		elif isinstance(max_samples, float) and 0.0 < max_samples <= 1.0:
+			sample_size = max(int(round(max_samples * rows)), 1)
+		elif isinstance(max_samples, (int, long, np.integer)) and not isinstance(max_samples, bool) and max_samples >= 1:
+			sample_size = int(max_samples)
+		else:
+			raise ValueError('max_samples must be a number of rows (at least 1) or a fraction in (0, 1].')
+		if sample_size is not None and sample_size > rows and not replace:
+			raise ValueError('A sample without replacement can not have more rows than the dataset.')
+		options = {'max_depth': max_depth, 'label': self.label, 'm': m, 'n_bins': n_bins, 'regression': self.regression, 'level_wise': level_wise,
+			'min_samples_split': min_samples_split, 'min_samples_leaf': min_samples_leaf, 'min_gain': min_gain, 'max_leaf_nodes': max_leaf_nodes,
+			'sample_size': sample_size, 'replace': replace}
+		if stats is not None:
+			options['stats'] = True
 
-		self.forest = []
-		for i in range(size):
-			tree_data = self.dataset.get_sample_with_replacement()
-			tree = Tree(tree_data, max_depth, self.label, m)
-			self.forest.append(tree)
+		if not warm_start or not self.forest:
+			self.forest = []
+			self.random_state = np.random.RandomState(seed) if seed is not None else np.random
+			self.classes = self.dataset.get_vocabulary(self.label) if not self.regression else None
+			self.vocabularies = dict((attribute, self.dataset.get_vocabulary(attribute)) for attribute in self.dataset.get_attributes() if attribute != self.label and not data.is_numeric(self.dataset.get_attribute_datatype(attribute)))
+			self.clear_out_of_bag()
+		elif oob and self.oob_votes is None:
+			raise ValueError('Out of bag estimates need every tree, grow the existing trees with oob=True.')
+		seeds = self.random_state.randint(0, 2**31 - 1, size=max(size - len(self.forest), 0))
+
+		if n_jobs is None or n_jobs < 1:
+			n_jobs = multiprocessing.cpu_count()
+
+		if not oob:
+			# the out of bag votes would miss the new trees
+			self.clear_out_of_bag()
+		elif self.oob_votes is None:
+			rows = self.dataset.count_rows()
+			self.oob_counts = np.zeros(rows, dtype=np.int32)
+			self.oob_votes = np.zeros(rows) if self.regression else np.zeros((rows, len(self.classes)))
+
+		if n_jobs == 1 or len(seeds) <= 1:
+			columns = encode_dataset(self.dataset, [attribute for attribute in self.dataset.get_attributes() if attribute != self.label]) if oob else None
+			self.forest.extend(self.collect_trees((grow_tree(self.dataset, tree_seed, self.classes, options, columns) for tree_seed in seeds), oob, stats))
+		else:
+			self.forest.extend(self.grow_parallel(seeds, options, n_jobs, oob, stats))
+
+		if oob:
+			self.set_out_of_bag()
+
+	def grow_until_converged(self, max_size, batch_size=10, tolerance=0.0, patience=1, validation=None, **options):
+		# grows batch_size trees at a time until the error hasn't improved by more than tolerance for patience batches
+		# in a row, or the forest has max_size trees; returns the number of trees grown
+		# the error is the out of bag error, or the error on validation datapoints if given, whose votes are
+		# accumulated so every tree predicts them once; self.errors holds the error after every batch
+		# options are passed on to grow, warm_start continues an existing forest
+		warm_start = options.pop('warm_start', False)
+		options['oob'] = validation is None
+		self.errors = []
+		best_error, stale = None, 0
+		predicted = 0
+		size = len(self.forest) if warm_start else 0
+
+		while size < max_size:
+			size = min(size + batch_size, max_size)
+			self.grow(size=size, warm_start=warm_start or bool(self.errors), **options)
+			if validation is None:
+				error = self.oob_error
+			else:
+				if predicted == 0:
+					columns = encode_datapoints(validation, self.vocabularies)
+					votes = np.zeros(validation.shape[0]) if self.regression else np.zeros((validation.shape[0], len(self.classes)))
+				for tree in self.forest[predicted:]:
+					votes += tree.predict_batch_values(validation, columns) if self.regression else tree.predict_batch_probabilities(validation, columns)
+				predicted = len(self.forest)
+				error = self.prediction_error(votes / predicted, validation[self.label])
+			self.errors.append(error)
+
+			if error is None or best_error is None or error < best_error - tolerance:
+				best_error = error if error is not None else best_error
+				stale = 0
+			else:
+				stale += 1
+				if stale >= patience:
+					break
+		return len(self.forest)
+
+	def grow_parallel(self, seeds, options, n_jobs, oob=False, stats=None):
+		# workers memory-map the training columns instead of receiving copies, from the directory the store
+		# is already mapped from or else from a temporary one it is saved to once, on the forest's first parallel
+		# grow, and that is removed with the forest
+		directory = self.dataset.store.directory or self.store_directory
+		if directory is None:
+			directory = tempfile.mkdtemp()
+			try:
+				self.dataset.store.save(directory)
+				self.store_directory = directory
+			finally:
+				if self.store_directory != directory:
+					shutil.rmtree(directory)
+		arguments = (directory, self.dataset.rows, self.dataset.weights, self.dataset.attributes, self.classes, options, oob)
+		pool = multiprocessing.Pool(min(n_jobs, len(seeds)), initializer=_init_worker, initargs=arguments)
+		try:
+			forest = self.collect_trees(pool.imap(_grow_tree, seeds), oob, stats)
+		finally:
+			pool.close()
+			pool.join()
+
+		for tree in forest:
+			tree.vocabularies = self.vocabularies
+		return forest
+
+	def collect_trees(self, results, oob, stats=None):
+		# keeps the trees as they are grown, adding each one's out of bag predictions to the forest's votes
+		# and its growth statistics to stats
+		forest = []
+		for result in results:
+			if oob:
+				result, out_of_bag, scores = result
+				self.oob_votes[out_of_bag] += scores
+				self.oob_counts[out_of_bag] += 1
+			if stats is not None:
+				stats.merge(result.stats)
+				del result.stats
+			forest.append(result)
+		return forest
+
+	def clear_out_of_bag(self):
+		# the estimates of set_out_of_bag, None unless every tree was grown with oob
+		self.oob_votes = None
+		self.oob_counts = None
+		self.oob_scores = None
+		self.oob_predictions = None
+		self.oob_error = None
+
+	def set_out_of_bag(self):
+		# oob_scores is the average out of bag prediction of every training row (class probabilities or values)
+		# summed up in oob_votes, oob_predictions the predicted label and oob_error the weighted prediction_error
+		# over the rows left out by at least one tree (oob_counts > 0)
+		counts = self.oob_counts if self.regression else self.oob_counts[:, np.newaxis]
+		with np.errstate(divide='ignore', invalid='ignore'):
+			self.oob_scores = self.oob_votes / counts
+		scored = self.oob_counts > 0
+		weights = self.dataset.get_weights()
+		weights = weights[scored] if weights is not None else None
+
+		if self.regression:
+			self.oob_predictions = self.oob_scores
+		else:
+			self.oob_predictions = self.classes[np.argmax(np.where(np.isnan(self.oob_scores), -1, self.oob_scores), axis=1)]
+		self.oob_error = self.prediction_error(self.oob_scores[scored], self.dataset.get_column(self.label)[scored], weights)
+
+	def prediction_error(self, scores, labels, weights=None):
+		# misclassification rate of averaged class probabilities, or mean squared error of averaged values for regression
+		if self.regression:
+			errors = (labels - scores)**2
+		else:
+			errors = self.classes[np.argmax(scores, axis=1)] != labels
+		return float(np.average(errors, weights=weights)) if errors.shape[0] else None
+
+	def predict_probabilities(self, datapoints):
+		# average class probabilities over the forest, one row per datapoint in the order of self.classes
+		# non-numeric columns are encoded once against the training vocabularies, trees then compare integer codes
+		columns = encode_datapoints(datapoints, self.vocabularies)
+		total_probabilities = np.zeros((datapoints.shape[0], len(self.classes)))
+		for tree in self.forest:
+			total_probabilities += tree.predict_batch_probabilities(datapoints, columns)
+		return total_probabilities / len(self.forest)
+
+	def save(self, directory):
+		# writes every FlatTree array of the forest concatenated into one .npy file, plus the node and membership
+		# offsets of each tree, the label classes, attribute vocabularies and a schema; no training data is kept
+		if not self.forest:
+			raise ValueError('Only a grown forest can be saved.')
+		attributes, numeric = self.forest[0].attributes, self.forest[0].numeric
+		with open(os.path.join(directory, self.SCHEMA_FILENAME), 'wb') as schema_file:
+			writer = csv.writer(schema_file)
+			writer.writerow(attributes)
+			writer.writerow([int(flag) for flag in numeric])
+			writer.writerow([self.label, int(self.regression), len(self.forest)])
+		for name in FlatTree.ARRAYS:
+			np.save(os.path.join(directory, '%s.npy' % name), np.concatenate([getattr(tree, name) for tree in self.forest]))
+		np.save(os.path.join(directory, 'nodes.npy'), np.cumsum([0] + [len(tree) for tree in self.forest]))
+		np.save(os.path.join(directory, 'memberships.npy'), np.cumsum([0] + [tree.membership.shape[0] for tree in self.forest]))
+		if not self.regression:
+			np.save(os.path.join(directory, 'classes.npy'), self.classes)
+		for index, attribute in enumerate(attributes):
+			if attribute in self.vocabularies:
+				np.save(os.path.join(directory, '%d.vocabulary.npy' % index), self.vocabularies[attribute])
+
+	@classmethod
+	def load(cls, directory, mmap_mode='r'):
+		# a forest for prediction whose trees are slices of the memory-mapped arrays of a saved forest,
+		# so loading is immediate and processes loading the same forest share one copy of its pages
+		with open(os.path.join(directory, cls.SCHEMA_FILENAME), 'rb') as schema_file:
+			reader = csv.reader(schema_file)
+			attributes = next(reader)
+			numeric = [flag == '1' for flag in next(reader)]
+			label, regression = next(reader)[:2]
+		regression = regression == '1'
+
+		arrays = dict((name, np.load(os.path.join(directory, '%s.npy' % name), mmap_mode=mmap_mode)) for name in FlatTree.ARRAYS)
+		nodes = np.load(os.path.join(directory, 'nodes.npy'))
+		memberships = np.load(os.path.join(directory, 'memberships.npy'))
+
+		forest = cls(None, label, regression)
+		forest.classes = np.load(os.path.join(directory, 'classes.npy'), allow_pickle=True) if not regression else None
+		forest.vocabularies = {}
+		for index, attribute in enumerate(attributes):
+			if not numeric[index]:
+				forest.vocabularies[attribute] = np.load(os.path.join(directory, '%d.vocabulary.npy' % index), allow_pickle=True)
+
+		for index in range(nodes.shape[0] - 1):
+			tree_arrays = dict((name, arrays[name][nodes[index]:nodes[index + 1]]) for name in FlatTree.ARRAYS)
+			tree_arrays['membership'] = arrays['membership'][memberships[index]:memberships[index + 1]]
+			forest.forest.append(FlatTree(None, attributes, numeric, forest.classes, forest.vocabularies, tree_arrays))
+		return forest
+
+	def predict_values(self, datapoints):
+		# average of the trees' leaf means for a regression forest, one value per datapoint
+		columns = encode_datapoints(datapoints, self.vocabularies)
+		total_values = np.zeros(datapoints.shape[0])
+		for tree in self.forest:
+			total_values += tree.predict_batch_values(datapoints, columns)
+		return total_values / len(self.forest)
 
 	def predict(self, datapoints):
 		# create a new structured array to hold datapoints + predictions
 		fields = datapoints.dtype.names
-		predictions = np.zeros(datapoints.shape[0], dtype=[(field, datapoints.dtype[field]) for field in fields] + [('_prediction', datapoints.dtype[self.label]), ('_probability', np.dtype(float))])
+		if self.regression:
+			predictions = np.zeros(datapoints.shape[0], dtype=[(field, datapoints.dtype[field]) for field in fields] + [('_prediction', np.dtype(float))])
+			for field in fields:
+				predictions[field] = datapoints[field]
+			predictions['_prediction'] = self.predict_values(datapoints)
+			return predictions
 
-		for index in range(datapoints.shape[0]):
-			datapoint = datapoints[index]
+		predictions = np.zeros(datapoints.shape[0], dtype=[(field, datapoints.dtype[field]) for field in fields] + [('_prediction', datapoints.dtype[self.label]), ('_probability', np.dtype(float))])
 
-			# calculate label probabilites and prediction
-			total_probabilities = {}
-			for tree in self.forest:
-				probabilities = tree.get_probabilities(datapoint)
-				for label, probability in probabilities.items():
-					total_probabilities[label] = total_probabilities.get(label, 0) + probability
-			for label in total_probabilities.keys():
-				total_probabilities[label] = total_probabilities[label] / len(self.forest)
+		probabilities = self.predict_probabilities(datapoints)
+		best = np.argmax(probabilities, axis=1)
 
-			point_prediction = prediction(total_probabilities, datapoints.dtype[self.label])
-			
-			for field in fields:
-				predictions[index][field] = datapoint[field]
-			predictions[index]['_prediction'] = point_prediction['_prediction']
-			predictions[index]['_probability'] = point_prediction['_probability']
+		for field in fields:
+			predictions[field] = datapoints[field]
+		predictions['_prediction'] = self.classes[best]
+		predictions['_probability'] = probabilities[np.arange(datapoints.shape[0]), best]
 
 		return predictions
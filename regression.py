@@ -1,28 +1,179 @@
 import data
 
+import multiprocessing
 import numpy as np
 
+def design_matrix(dataset, predictors):
+	# (rows x predictors) float matrix of the predictor columns, filled column by column in Fortran order for LAPACK
+	matrix = np.empty((dataset.count_rows(), len(predictors)), order='F')
+	for index, predictor in enumerate(predictors):
+		matrix[:, index] = dataset.get_column(predictor)
+	return matrix
+
+def solve_normal_equations(gram, products, ridge=0.0):
+	# coefficients solving (gram + ridge * I) coefficients = products by a Cholesky factorization
+	gram = gram + ridge * np.eye(gram.shape[0])
+	if gram.shape[0] == 1:
+		# the closed form, without rounding through a square root
+		return products / gram[0]
+	lower = np.linalg.cholesky(gram)
+	return np.linalg.solve(lower.T, np.linalg.solve(lower, products))
+
+class SufficientStatistics():
+	# weighted count, means and centered cross-products (comoments) of the columns [predictors..., label]
+	# least squares can be solved from these without the rows; statistics of different chunks merge exactly
+	# (up to rounding), in any order, with the pairwise update of Chan et al., which stays accurate for large means
+
+	def __init__(self, n_columns):
+		self.count = 0.0
+		self.means = np.zeros(n_columns)
+		self.comoments = np.zeros((n_columns, n_columns))
+
+	def update(self, columns, weights=None):
+		# adds a chunk given as a (rows x columns) array, rows optionally weighted
+		columns = np.asarray(columns, dtype=float)
+		if columns.shape[0] == 0:
+			return self
+		chunk = SufficientStatistics(columns.shape[1])
+		chunk.count = float(columns.shape[0]) if weights is None else float(np.sum(weights))
+		chunk.means = np.average(columns, axis=0, weights=weights)
+		centered = columns - chunk.means
+		chunk.comoments = centered.T.dot(centered if weights is None else centered * np.asarray(weights, dtype=float)[:, np.newaxis])
+		return self.merge(chunk)
+
+	def merge(self, other):
+		if other.count == 0:
+			return self
+		count = self.count + other.count
+		delta = other.means - self.means
+		self.comoments = self.comoments + other.comoments + np.outer(delta, delta) * (self.count * other.count / count)
+		self.means = self.means + delta * (other.count / count)
+		self.count = count
+		return self
+
+	def solve(self, ridge=0.0):
+		# (coefficients, intercept) of the last column regressed on the others
+		coefficients = solve_normal_equations(self.comoments[:-1, :-1], self.comoments[:-1, -1], ridge)
+		return (coefficients, self.means[-1] - self.means[:-1].dot(coefficients))
+
+def _csv_block_statistics(arguments):
+	filename, dtypes, start, end, columns = arguments
+	return SufficientStatistics(len(columns)).update(np.column_stack(data.read_csv_block(filename, dtypes, start, end, columns)))
+
+def csv_statistics(filename, columns, chunk_size=65536, n_jobs=1, block_size=1 << 25):
+	# SufficientStatistics of the named columns of a csv file, read chunk by chunk without loading the file
+	# with n_jobs > 1 byte blocks are parsed and accumulated in worker processes and merged at the end
+	attributes, dtypes, offset = data.read_csv_header(filename)
+	indices = [attributes.index(column) for column in columns]
+	if not all(data.is_numeric(dtypes[index]) for index in indices):
+		raise ValueError('Both the predictor and label must be numeric')
+
+	statistics = SufficientStatistics(len(columns))
+	if n_jobs == 1:
+		for chunk in data.iter_csv_chunks(filename, dtypes, offset, chunk_size, columns=indices):
+			statistics.update(np.column_stack(chunk))
+		return statistics
+
+	tasks = [(filename, dtypes, start, end, indices) for start, end in data.csv_blocks(filename, offset, block_size)]
+	pool = multiprocessing.Pool(n_jobs)
+	try:
+		for block_statistics in pool.imap(_csv_block_statistics, tasks):
+			statistics.merge(block_statistics)
+	finally:
+		pool.close()
+		pool.join()
+	return statistics
+
+def dataset_statistics(dataset, columns, chunk_size=65536):
+	# SufficientStatistics of the named columns of a DataSet, chunk_size rows at a time
+	# only one chunk of the view's rows is read from the store at a time, so memory-mapped columns stay on disk
+	if not all(data.is_numeric(dataset.get_attribute_datatype(column)) for column in columns):
+		raise ValueError('Both the predictor and label must be numeric')
+	weights = dataset.get_weights()
+	statistics = SufficientStatistics(len(columns))
+	for start in range(0, dataset.count_rows(), chunk_size):
+		end = start + chunk_size
+		rows = slice(start, end) if dataset.rows is None else dataset.rows[start:end]
+		statistics.update(np.column_stack([dataset.store.get_values(column, rows) for column in columns]), weights[start:end] if weights is not None else None)
+	return statistics
+
 class LinearRegression():
 
 	def __init__(self, dataset):
 		self.dataset = dataset
 
-	def least_squares(self, predictor, label):
-		if not data.is_numeric(self.dataset.get_attribute_datatype(predictor)) or not data.is_numeric(self.dataset.get_attribute_datatype(label)):
+	def least_squares(self, predictor, label, ridge=0.0, solver=None):
+		# predictor is one column name or a list of them, the fit is label ~ b0 + coefficients . predictors
+		# ridge penalizes the squared coefficients (not the intercept)
+		# solver is 'qr' or 'cholesky' of the normal equations, which is the default with ridge or a single predictor
+		predictors = [predictor] if isinstance(predictor, str) else list(predictor)
+		if not all(data.is_numeric(self.dataset.get_attribute_datatype(attribute)) for attribute in predictors + [label]):
 			raise ValueError('Both the predictor and label must be numeric')
+		if solver is None:
+			solver = 'cholesky' if ridge or len(predictors) == 1 else 'qr'
+
+		xs = design_matrix(self.dataset, predictors)
+		ys = self.dataset.get_column(label).astype(float)
+		weights = self.dataset.get_weights()
+
+		# centering removes the intercept from the solve, weighted rows count as repeated rows
+		mean_x = np.average(xs, axis=0, weights=weights)
+		mean_y = np.average(ys, weights=weights)
+		xs -= mean_x
+		ys -= mean_y
+		if weights is not None:
+			scale = np.sqrt(weights)
+			xs *= scale[:, np.newaxis]
+			ys *= scale
+
+		if solver == 'qr':
+			if ridge:
+				# ridge as least squares on rows extended by sqrt(ridge) * identity
+				xs = np.vstack([xs, np.sqrt(ridge) * np.eye(len(predictors))])
+				ys = np.concatenate([ys, np.zeros(len(predictors))])
+			q, r = np.linalg.qr(xs)
+			coefficients = np.linalg.solve(r, q.T.dot(ys))
+		elif solver == 'cholesky':
+			coefficients = solve_normal_equations(xs.T.dot(xs), xs.T.dot(ys), ridge)
+		else:
+			raise ValueError('Unknown solver %s.' % solver)
 
-		n = len(self.dataset)
-		xs = self.dataset.get_column_vector(predictor)
-		ys = self.dataset.get_column_vector(label)
+		self.set_coefficients(predictors, coefficients, mean_y - mean_x.dot(coefficients))
 
-		mean_x = xs.mean()
-		mean_y = ys.mean()
+	def streaming_least_squares(self, predictor, label, ridge=0.0, source=None, chunk_size=65536, n_jobs=1):
+		# least squares from SufficientStatistics accumulated chunk by chunk, for data that doesn't fit in memory
+		# source is a csv filename or DataSet, by default this regression's dataset; csv files are never loaded whole
+		# and with n_jobs > 1 their blocks are accumulated in worker processes
+		predictors = [predictor] if isinstance(predictor, str) else list(predictor)
+		if source is None:
+			source = self.dataset
+		if isinstance(source, data.DataSet):
+			statistics = dataset_statistics(source, predictors + [label], chunk_size)
+		else:
+			statistics = csv_statistics(source, predictors + [label], chunk_size, n_jobs)
+		self.fit_statistics(statistics, predictors, ridge)
+		return statistics
 
-		b1 = ((xs - mean_x) * (ys - mean_y)).sum() / ((xs - mean_x) ** 2).sum()
-		b0 = (float(ys.sum()) / n) - b1 * (float(xs.sum()) / n)
+	def fit_statistics(self, statistics, predictors, ridge=0.0):
+		# fits the label (the statistics' last column) on the predictors (the others), e.g. after merging partial statistics
+		coefficients, intercept = statistics.solve(ridge)
+		self.set_coefficients(predictors, coefficients, intercept)
 
-		self.b1 = b1
-		self.b0 = b0
+	def set_coefficients(self, predictors, coefficients, intercept):
+		self.predictors = predictors
+		self.coefficients = coefficients
+		self.intercept = intercept
+		self.b1 = coefficients[0] if len(predictors) == 1 else coefficients
+		self.b0 = self.intercept
 
 	def predict(self, value):
-		return self.b1 * value + self.b0
\ No newline at end of file
+		# value is a number or array of values of a single predictor, a (rows x predictors) array,
+		# or a structured array or DataSet holding the predictor columns
+		if isinstance(value, data.DataSet):
+			return design_matrix(value, self.predictors).dot(self.coefficients) + self.intercept
+		if isinstance(value, np.ndarray) and value.dtype.names:
+			return np.column_stack([value[predictor] for predictor in self.predictors]).astype(float).dot(self.coefficients) + self.intercept
+		value = np.asarray(value, dtype=float)
+		if len(self.predictors) == 1 and (value.ndim < 2 or value.shape[1] != 1):
+			return self.coefficients[0] * value + self.intercept
+		return value.dot(self.coefficients) + self.intercept
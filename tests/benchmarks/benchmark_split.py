@@ -0,0 +1,43 @@
+import sys
+sys.path.append('../../')
+
+import data
+import objectives
+
+import numpy as np
+import time
+
+'''
+Compares the vectorized split search with the SortedIterator scan it replaced.
+Usage: python benchmark_split.py [rows] [attributes]
+'''
+
+def synthetic_dataset(rows, attributes, seed=0):
+	rng = np.random.RandomState(seed)
+	dtypes = [('attr%d' % i, np.dtype(float) if i % 2 else np.dtype(int)) for i in range(attributes)] + [('label', np.dtype(bool))]
+	datapoints = np.zeros(rows, dtype=dtypes)
+	for i in range(attributes):
+		if i % 2:
+			datapoints['attr%d' % i] = rng.normal(size=rows)
+		else:
+			datapoints['attr%d' % i] = rng.randint(0, 100, size=rows)
+	datapoints['label'] = (datapoints['attr0'] + rng.randint(0, 50, size=rows)) > 75
+	return data.DataSet(datapoints=datapoints)
+
+def timed(function, *args):
+	start = time.time()
+	result = function(*args)
+	return result, time.time() - start
+
+if __name__ == '__main__':
+	rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+	attributes = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+	dataset = synthetic_dataset(rows, attributes)
+
+	iterator_result, iterator_time = timed(objectives.find_optimal_split_iterator, dataset, 'label')
+	vectorized_result, vectorized_time = timed(objectives.find_optimal_split, dataset, 'label')
+
+	print('rows: %d, attributes: %d' % (rows, attributes))
+	print('iterator:   %.4fs %s' % (iterator_time, str(iterator_result)))
+	print('vectorized: %.4fs %s' % (vectorized_time, str(vectorized_result)))
+	print('speedup:    %.1fx' % (iterator_time / max(vectorized_time, 1e-9)))
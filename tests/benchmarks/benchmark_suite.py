@@ -0,0 +1,165 @@
+import sys
+sys.path.append('../../')
+
+import data
+import objectives
+import random_forest
+import regression
+
+import argparse
+import csv
+import json
+import multiprocessing
+import numpy as np
+import os
+import platform
+import resource
+import shutil
+import tempfile
+import time
+
+'''
+Times csv loading, split search, tree and forest growth, prediction and least squares on synthetic data
+scaling over rows, attributes, label classes and column types, and measures the peak memory of each.
+Every measurement runs in its own forked process, results are written as json so runs can be compared:
+	python benchmark_suite.py --output before.json
+	python benchmark_suite.py --output after.json --compare before.json
+'''
+
+NP_TYPES = {'int': np.dtype(int), 'float': np.dtype(float), 'boolean': np.dtype(bool), 'text': np.dtype(object)}
+
+def synthetic_datapoints(rows, attributes, n_classes=2, types=('int', 'float'), seed=0):
+	# attribute i has type types[i % len(types)], the text label with n_classes values depends on every attribute
+	rng = np.random.RandomState(seed)
+	dtypes = [('attr%d' % i, NP_TYPES[types[i % len(types)]]) for i in range(attributes)] + [('label', NP_TYPES['text'])]
+	datapoints = np.zeros(rows, dtype=dtypes)
+	signal = rng.normal(size=rows)
+	for i in range(attributes):
+		values = rng.normal(size=rows)
+		signal += values
+		column_type = types[i % len(types)]
+		if column_type == 'int':
+			datapoints['attr%d' % i] = (values * 25).astype(int)
+		elif column_type == 'float':
+			datapoints['attr%d' % i] = values
+		elif column_type == 'boolean':
+			datapoints['attr%d' % i] = values > 0
+		else:
+			datapoints['attr%d' % i] = np.array(['word%d' % code for code in range(20)], dtype=object)[np.clip((values * 5 + 10).astype(int), 0, 19)]
+	quantiles = np.percentile(signal, np.linspace(0, 100, n_classes + 1)[1:-1])
+	datapoints['label'] = np.array(['class%d' % code for code in range(n_classes)], dtype=object)[np.searchsorted(quantiles, signal)]
+	return datapoints
+
+def write_csv(datapoints, filename, types):
+	# the two header rows of the csv format described in data.py
+	with open(filename, 'wb') as csv_file:
+		writer = csv.writer(csv_file)
+		writer.writerow(datapoints.dtype.names)
+		writer.writerow([types[i % len(types)] for i in range(len(datapoints.dtype.names) - 1)] + ['text'])
+		writer.writerows(datapoints.tolist())
+
+def _measure(connection, function, args):
+	before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	start = time.time()
+	function(*args)
+	seconds = time.time() - start
+	connection.send((seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before))
+	connection.close()
+
+def measure(function, *args):
+	# (seconds, peak memory in kilobytes) of one call, the memory is the growth of the forked process's
+	# peak resident set size over its size when the call started, so set up data in the parent first
+	receiver, sender = multiprocessing.Pipe(duplex=False)
+	process = multiprocessing.Process(target=_measure, args=(sender, function, args))
+	process.start()
+	result = receiver.recv()
+	process.join()
+	return result
+
+def least_squares(rows, seed=0):
+	rng = np.random.RandomState(seed)
+	datapoints = np.zeros(rows, dtype=[('predictor', np.dtype(float)), ('label', np.dtype(float))])
+	datapoints['predictor'] = rng.normal(size=rows)
+	datapoints['label'] = 3 * datapoints['predictor'] + rng.normal(size=rows)
+	return regression.LinearRegression(data.DataSet(datapoints=datapoints))
+
+def benchmarks(options):
+	# yields (name, parameters, function, args) for every combination of the scaling options
+	for rows in options.rows:
+		yield ('least_squares', {'rows': rows}, least_squares(rows).least_squares, ('predictor', 'label'))
+		for attributes in options.attributes:
+			for n_classes in options.classes:
+				for types in options.types:
+					parameters = {'rows': rows, 'attributes': attributes, 'classes': n_classes, 'types': ','.join(types)}
+					datapoints = synthetic_datapoints(rows, attributes, n_classes, types)
+					dataset = data.DataSet(datapoints=datapoints)
+
+					filename = os.path.join(options.directory, 'benchmark.csv')
+					write_csv(datapoints, filename, types)
+					yield ('init_data_from_csv', parameters, dataset.init_data_from_csv, (filename,))
+					yield ('find_optimal_split', parameters, objectives.find_optimal_split, (dataset, 'label'))
+
+					m = max(1, int(np.sqrt(attributes)))
+					for depth in options.depths:
+						yield ('tree', dict(parameters, depth=depth), random_forest.Tree, (dataset, depth, 'label', m, 0))
+						yield ('tree_histogram', dict(parameters, depth=depth), lambda depth=depth: random_forest.Tree(dataset, depth, 'label', m, 0, n_bins=options.bins), ())
+
+					forest = random_forest.RandomForest(dataset, 'label')
+					forest_parameters = dict(parameters, depth=max(options.depths), trees=options.trees)
+					grow = lambda: forest.grow(max_depth=max(options.depths), size=options.trees, m=m, seed=0, n_jobs=options.jobs)
+					yield ('forest_grow', forest_parameters, grow, ())
+					grow()
+					yield ('forest_predict', forest_parameters, forest.predict, (datapoints,))
+
+def result_key(result):
+	return tuple(sorted((name, value) for name, value in result.items() if name not in ('seconds', 'peak_kb')))
+
+def compare(results, previous):
+	# prints the time and memory ratios of every benchmark found in both runs
+	previous = dict((result_key(result), result) for result in previous['results'])
+	print('%-20s %-60s %10s %10s %8s %10s' % ('benchmark', 'parameters', 'before', 'after', 'ratio', 'memory'))
+	for result in results:
+		old = previous.get(result_key(result))
+		if old is None:
+			continue
+		parameters = ' '.join('%s=%s' % item for item in result_key(result) if item[0] != 'benchmark')
+		memory_ratio = float(result['peak_kb']) / old['peak_kb'] if old['peak_kb'] else float('nan')
+		print('%-20s %-60s %9.4fs %9.4fs %7.2fx %9.2fx' % (result['benchmark'], parameters, old['seconds'], result['seconds'], result['seconds'] / max(old['seconds'], 1e-9), memory_ratio))
+
+def parse_arguments(arguments):
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000])
+	parser.add_argument('--attributes', type=int, nargs='+', default=[4, 16])
+	parser.add_argument('--classes', type=int, nargs='+', default=[2, 5])
+	parser.add_argument('--types', nargs='+', default=['int,float', 'int,float,text,boolean'], help='comma separated column types, one combination per argument')
+	parser.add_argument('--depths', type=int, nargs='+', default=[2, 6])
+	parser.add_argument('--trees', type=int, default=10)
+	parser.add_argument('--bins', type=int, default=64)
+	parser.add_argument('--jobs', type=int, default=1)
+	parser.add_argument('--repeat', type=int, default=3, help='the fastest time and largest peak memory of the repeats are kept')
+	parser.add_argument('--output', default='benchmark_results.json')
+	parser.add_argument('--compare', help='results of an earlier run to compare against')
+	options = parser.parse_args(arguments)
+	options.types = [tuple(types.split(',')) for types in options.types]
+	return options
+
+if __name__ == '__main__':
+	options = parse_arguments(sys.argv[1:])
+	options.directory = tempfile.mkdtemp()
+	results = []
+	try:
+		for name, parameters, function, args in benchmarks(options):
+			measurements = [measure(function, *args) for _ in range(options.repeat)]
+			result = dict(parameters, benchmark=name, seconds=min(seconds for seconds, _ in measurements), peak_kb=max(peak for _, peak in measurements))
+			results.append(result)
+			print('%-20s %-60s %9.4fs %10dkB' % (name, ' '.join('%s=%s' % item for item in sorted(parameters.items())), result['seconds'], result['peak_kb']))
+	finally:
+		shutil.rmtree(options.directory)
+
+	run = {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}
+	with open(options.output, 'w') as output_file:
+		json.dump(run, output_file, indent=1, sort_keys=True)
+
+	if options.compare:
+		with open(options.compare) as previous_file:
+			compare(results, json.load(previous_file))
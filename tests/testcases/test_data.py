@@ -4,6 +4,10 @@ sys.path.append('../../')
 import data
 
 import numpy as np
+import os
+import shutil
+import sqlite3
+import tempfile
 import unittest
 
 class TestData(unittest.TestCase):
@@ -33,6 +37,154 @@ class TestData(unittest.TestCase):
 		self.assertEqual(testdataset.datapoints.shape, self.mixeddata_shape)
 		self.assertTrue(np.array_equal(testdataset.datapoints, expected))
 
+	def testReadCsvColumns_chunked(self):
+		expected = data.DataSet(self.mixeddata_fname).datapoints
+		store = data.read_csv_columns(self.mixeddata_fname, chunk_size=1)
+
+		self.assertTrue(np.array_equal(data.DataSet(store=store).datapoints, expected))
+
+	def testIterCsvChunks_parallel(self):
+		attributes, dtypes, offset = data.read_csv_header(self.mixeddata_fname)
+		chunks = list(data.iter_csv_chunks(self.mixeddata_fname, dtypes, offset, n_jobs=2, block_size=8))
+
+		self.assertTrue(len(chunks) > 1)
+		self.assertTrue(np.array_equal(np.concatenate([chunk[2] for chunk in chunks]), np.array(['hi', 'hello', 'hello', 'hi'], dtype=object)))
+		self.assertTrue(np.array_equal(np.concatenate([chunk[3] for chunk in chunks]), np.array([True, False, False, True])))
+
+	def testCsv_lineEndings(self):
+		directory = tempfile.mkdtemp()
+		try:
+			filename = os.path.join(directory, 'data.csv')
+			for ending in ['\r', '\r\n']:
+				with open(filename, 'wb') as csv_file:
+					csv_file.write(ending.join(['a,b', 'int,text', '1,x', '3,y']))
+				for n_jobs in [1, 2]:
+					testdataset = data.DataSet(filename, n_jobs=n_jobs)
+					self.assertTrue(np.array_equal(testdataset.get_column('a'), np.array([1, 3])))
+					self.assertTrue(np.array_equal(testdataset.get_column('b'), np.array(['x', 'y'], dtype=object)))
+		finally:
+			shutil.rmtree(directory)
+
+	def testCachedCsv(self):
+		cache_dir = tempfile.mkdtemp()
+		try:
+			expected = data.DataSet(self.mixeddata_fname).datapoints
+			data.DataSet(self.mixeddata_fname, cache_dir=cache_dir)
+			testdataset = data.DataSet(self.mixeddata_fname, cache_dir=cache_dir)
+
+			self.assertEqual(len(os.listdir(cache_dir)), 1)
+			self.assertEqual(testdataset.store.columns, {})
+			self.assertTrue(isinstance(testdataset.get_column('float'), np.memmap))
+			self.assertEqual(list(testdataset.store.columns.keys()), ['float'])
+			self.assertTrue(np.array_equal(testdataset.datapoints, expected))
+		finally:
+			shutil.rmtree(cache_dir)
+
+	def testCachedCsv_removesStaleCaches(self):
+		directory = tempfile.mkdtemp()
+		try:
+			filename = os.path.join(directory, 'data.csv')
+			cache_dir = os.path.join(directory, 'cache')
+			shutil.copy(self.intdata_fname, filename)
+			data.DataSet(filename, cache_dir=cache_dir)
+			with open(filename, 'ab') as csv_file:
+				csv_file.write('\n7,7,7')
+			testdataset = data.DataSet(filename, cache_dir=cache_dir)
+
+			self.assertEqual(os.listdir(cache_dir), [data.cache_prefix(filename) + data.file_cache_key(filename)])
+			self.assertEqual(testdataset.get_column(testdataset.get_attributes()[0])[-1], 7)
+		finally:
+			shutil.rmtree(directory)
+
+	def testCachedCsv_sameBasename(self):
+		directory = tempfile.mkdtemp()
+		try:
+			cache_dir = os.path.join(directory, 'cache')
+			filenames = [os.path.join(directory, name, 'data.csv') for name in ['a', 'b']]
+			for filename in filenames:
+				os.mkdir(os.path.dirname(filename))
+				shutil.copy(self.intdata_fname, filename)
+			with open(filenames[1], 'ab') as csv_file:
+				csv_file.write('\n7,7,7')
+			first = data.DataSet(filenames[0], cache_dir=cache_dir)
+			second = data.DataSet(filenames[1], cache_dir=cache_dir)
+
+			self.assertEqual(len(os.listdir(cache_dir)), 2)
+			self.assertEqual(len(first.get_column(first.get_attributes()[0])) + 1, len(second.get_column(second.get_attributes()[0])))
+		finally:
+			shutil.rmtree(directory)
+
+	def testFileCacheKey_changesWithContent(self):
+		directory = tempfile.mkdtemp()
+		try:
+			filename = os.path.join(directory, 'data.csv')
+			shutil.copy(self.intdata_fname, filename)
+			key = data.file_cache_key(filename)
+			with open(filename, 'ab') as csv_file:
+				csv_file.write('7,7,7\n')
+
+			self.assertNotEqual(data.file_cache_key(filename), key)
+		finally:
+			shutil.rmtree(directory)
+
+	def createSqliteData(self, directory):
+		filename = os.path.join(directory, 'mixeddata.sqlite')
+		connection = sqlite3.connect(filename)
+		connection.execute('CREATE TABLE mixed ("int" INTEGER, "float" REAL, "text" TEXT, "boolean" BOOLEAN)')
+		connection.executemany('INSERT INTO mixed VALUES (?, ?, ?, ?)', [(1, 0.5, 'hi', 1), (1, 0.5, 'hello', 0), (7, 0.0, 'hello', 0), (-4, 99.1, 'hi', 1)])
+		connection.commit()
+		connection.close()
+		return filename
+
+	def testSqliteData(self):
+		directory = tempfile.mkdtemp()
+		try:
+			testdataset = data.DataSet(self.createSqliteData(directory))
+			expected = data.DataSet(self.mixeddata_fname)
+
+			self.assertEqual(testdataset.datapoints.dtype, self.mixeddata_dtypes)
+			self.assertTrue(np.array_equal(testdataset.datapoints, expected.datapoints))
+		finally:
+			shutil.rmtree(directory)
+
+	def testSqliteData_pushdown(self):
+		directory = tempfile.mkdtemp()
+		try:
+			filename = self.createSqliteData(directory)
+			testdataset = data.DataSet(filename, table='mixed', attributes=['text', 'int'], limit=3)
+			sampled = data.DataSet(filename, sample=0.0)
+
+			self.assertEqual(testdataset.store.names, ('text', 'int'))
+			self.assertTrue(np.array_equal(testdataset.get_column('int'), np.array([1, 1, 7])))
+			self.assertEqual(len(sampled), 0)
+			self.assertRaises(ValueError, lambda: data.DataSet(filename, attributes=['missing']))
+
+			connection = sqlite3.connect(filename)
+			connection.execute('INSERT INTO mixed VALUES (NULL, NULL, NULL, NULL)')
+			connection.commit()
+			connection.close()
+			self.assertTrue(np.isnan(data.DataSet(filename, attributes=['float']).get_column('float')[-1]))
+			self.assertRaises(ValueError, lambda: data.DataSet(filename, attributes=['int']))
+		finally:
+			shutil.rmtree(directory)
+
+	def testEncodedText(self):
+		testdataset = data.DataSet(self.mixeddata_fname)
+		vocabulary, codes = testdataset.get_codes('text')
+
+		self.assertTrue(testdataset.is_encoded('text'))
+		self.assertFalse(testdataset.is_encoded('int'))
+		self.assertEqual(testdataset.store['text'].dtype, data.CODE_DTYPE)
+		self.assertEqual(list(vocabulary), ['hello', 'hi'])
+		self.assertTrue(np.array_equal(codes, np.array([1, 0, 0, 1])))
+		self.assertEqual(testdataset.get_attribute_datatype('text'), np.dtype(object))
+
+	def testEncodeValues(self):
+		vocabulary = np.array(['hello', 'hi'], dtype=object)
+		codes = data.encode_values(vocabulary, np.array(['hi', 'hey', 'hello', 'zzz'], dtype=object))
+
+		self.assertTrue(np.array_equal(codes, np.array([1, -1, 0, -1])))
+
 	def testInit_givenData(self):
 		datapoints = np.array([(1,0,2),(5,3,3),(2,1,1)], dtype=self.intdata_dtypes)
 		datatypes = self.intdata_dtypes
@@ -120,6 +272,105 @@ class TestData(unittest.TestCase):
 		self.assertTrue(np.array_equal(splits[0].datapoints['text'], np.array(['hello', 'hello'])))
 		self.assertTrue(np.array_equal(splits[1].datapoints['text'], np.array(['hi', 'hi'])))
 
+	def testSplit_sharesStore(self):
+		testdataset = data.DataSet(self.mixeddata_fname)
+		left, right = testdataset.split_data('int', 0)
+
+		self.assertTrue(left.store is testdataset.store)
+		self.assertTrue(right.store is testdataset.store)
+		self.assertTrue(np.array_equal(right.get_row_indices(), np.array([0, 1, 2])))
+
+	def testSelectColumns_view(self):
+		testdataset = data.DataSet(self.mixeddata_fname)
+		projection = testdataset.split_data('int', 0)[1].select_columns(['int', 'text'])
+
+		self.assertTrue(projection.store is testdataset.store)
+		self.assertEqual(projection.get_attributes(), ('int', 'text'))
+		self.assertEqual(projection.datapoints.dtype, [('int', 'int64'), ('text', 'object')])
+		self.assertTrue(np.array_equal(projection.get_column('text'), np.array(['hi', 'hello', 'hello'], dtype=object)))
+
+	def testMaterialize(self):
+		testdataset = data.DataSet(self.mixeddata_fname, ratio_validation=0.25)
+		materialized = testdataset.materialize()
+
+		self.assertFalse(materialized.store is testdataset.store)
+		self.assertEqual(len(materialized.store), 3)
+		self.assertTrue(np.array_equal(materialized.datapoints, testdataset.datapoints))
+
+	def testSampleWithReplacement_weights(self):
+		testdataset = data.DataSet(self.mixeddata_fname)
+		sample = testdataset.get_sample_with_replacement()
+
+		self.assertTrue(sample.store is testdataset.store)
+		self.assertEqual(len(sample), 4)
+		self.assertEqual(sample.get_weights().sum(), 4)
+		self.assertEqual(sample.count_rows(), np.unique(sample.get_row_indices()).shape[0])
+		self.assertEqual(sample.datapoints.shape, (4,))
+
+	def testDrawSample(self):
+		testdataset = data.DataSet(datapoints=np.zeros(1000, dtype=[('value', 'int64')]))
+		positions, counts = testdataset.draw_sample(100, replace=False, random_state=np.random.RandomState(0))
+		self.assertEqual(counts, None)
+		self.assertEqual(positions.shape, (100,))
+		self.assertTrue(np.all(np.diff(positions) > 0))
+
+		positions, counts = testdataset.draw_sample(100, random_state=np.random.RandomState(0))
+		self.assertEqual(counts.sum(), 100)
+		self.assertTrue(np.all(np.diff(positions) > 0))
+
+		view = testdataset.view(rows=np.arange(500, 1000))
+		sample = view.select_sample(*view.draw_sample(50, replace=False))
+		self.assertEqual(len(sample), 50)
+		self.assertTrue(np.all(sample.get_row_indices() >= 500))
+		self.assertRaises(ValueError, view.draw_sample, 600, replace=False)
+
+		weighted = testdataset.view(rows=np.arange(10), weights=np.full(10, 3))
+		positions, counts = weighted.draw_sample(replace=False)
+		self.assertTrue(np.array_equal(positions, np.arange(10)))
+		self.assertEqual(weighted.draw_sample()[1].sum(), 30)
+
+	def testCountLabels_weighted(self):
+		testdataset = data.DataSet(self.mixeddata_fname)
+		sample = testdataset.view(rows=np.array([0, 2]), weights=np.array([3, 1]))
+
+		self.assertEqual(sample.count_labels('text'), {'hi':3, 'hello':1})
+
+	def testQuantileBins_fewValues(self):
+		values, bins = data.quantile_bins(np.array([3, 1, 2, 3, 1]), 4)
+
+		self.assertTrue(np.array_equal(values, np.array([1, 2, 3])))
+		self.assertTrue(np.array_equal(bins, np.array([2, 0, 1, 2, 0])))
+
+	def testQuantileBins_manyValues(self):
+		column = np.random.normal(size=1000)
+		values, bins = data.quantile_bins(column, 16)
+
+		self.assertTrue(values.shape[0] <= 16)
+		self.assertEqual(bins.dtype, np.uint8)
+		self.assertTrue(np.all(column >= values[bins]))
+		self.assertTrue(np.all(column[bins < values.shape[0] - 1] < values[np.minimum(bins + 1, values.shape[0] - 1)][bins < values.shape[0] - 1]))
+
+	def testBins_view(self):
+		rng = np.random.RandomState(0)
+		datapoints = np.zeros(1000, dtype=[('value', 'float64'), ('flag', 'bool')])
+		datapoints['value'] = rng.normal(size=1000)
+		datapoints['flag'] = rng.rand(1000) > 0.5
+		testdataset = data.DataSet(datapoints=datapoints)
+		rows = np.array([3, 10, 500, 999])
+		view = testdataset.view(rows=rows)
+
+		values, bins = view.get_bins('value', 8)
+		self.assertTrue(np.array_equal(bins, data.assign_bins(values, datapoints['value'][rows])))
+		sampled = testdataset.store.get_bin_values('value', 4, sample_size=100)
+		self.assertEqual(sampled.shape, (4,))
+		self.assertTrue(np.all(np.in1d(sampled, datapoints['value'])))
+		vocabulary, codes = view.get_codes('flag')
+		self.assertEqual(list(vocabulary), [False, True])
+		self.assertTrue(np.array_equal(codes, datapoints['flag'][rows].astype(int)))
+		# only the small per-column summaries are kept by the store
+		self.assertEqual(testdataset.store.bins[('value', 8)].shape, (8,))
+		self.assertEqual(testdataset.store.distinct['flag'].shape, (2,))
+
 	def testIterator_iterate(self):
 		testdataset = data.DataSet(self.mixeddata_fname)
 		iterator = testdataset.get_sorted_iterator()
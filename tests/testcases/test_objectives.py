@@ -141,6 +141,74 @@ class TestObjectives(unittest.TestCase):
 		self.assertEqual(resultattribute, expectedattribute)
 		self.assertTrue(abs(resultgain-expectedgain) < 0.001)
 
+	def testFindOptimalSplit_matchesIterator(self):
+		testdataset = data.DataSet(self.split_fname)
+		for attribute in ['easy_split', 'no_split', 'medium_split', None]:
+			result = objectives.find_optimal_split(testdataset, 'label', attribute=attribute)
+			expected = objectives.find_optimal_split_iterator(testdataset, 'label', attribute=attribute)
+
+			self.assertEqual(result[:2], expected[:2])
+			self.assertTrue(abs(result[2]-expected[2]) < 0.000001)
+
+	def testFindOptimalSplit_text(self):
+		testdataset = data.DataSet(self.informationgain_fname)
+		resultthreshold, resultattribute, resultgain = objectives.find_optimal_split(testdataset, 'label', attribute='gain_text')
+		split_datasets = testdataset.split_data(resultattribute, resultthreshold)
+		counts = testdataset.count_labels('label')
+		expectedgain = objectives.information_gain(counts, split_datasets[0].count_labels('label'), split_datasets[1].count_labels('label'))
+
+		self.assertEqual(resultattribute, 'gain_text')
+		self.assertTrue(abs(resultgain-expectedgain) < 0.000001)
+		self.assertTrue(resultgain >= objectives.find_optimal_split_iterator(testdataset, 'label', attribute='gain_text')[2] - 0.000001)
+
+	def testFindOptimalSplit_categorySubset(self):
+		# no single category separates the labels, a pair of categories does
+		datapoints = np.array([(category, category in ('a', 'c')) for category in 'abcdabcd'], dtype=[('category', 'object'), ('label', 'bool')])
+		resultthreshold, resultattribute, resultgain = objectives.find_optimal_split(data.DataSet(datapoints=datapoints), 'label')
+
+		self.assertEqual(resultattribute, 'category')
+		self.assertTrue(sorted(resultthreshold) in (['a', 'c'], ['b', 'd']))
+		self.assertEqual(resultgain, 1.0)
+
+	def testFindOptimalSplit_weighted(self):
+		testdataset = data.DataSet(self.split_fname)
+		weighted = testdataset.view(rows=np.array([0, 2, 4, 5, 7]), weights=np.array([2, 1, 3, 1, 2]))
+		result = objectives.find_optimal_split(weighted, 'label')
+		expected = objectives.find_optimal_split(data.DataSet(datapoints=weighted.datapoints), 'label')
+
+		self.assertEqual(result[:2], expected[:2])
+		self.assertTrue(abs(result[2]-expected[2]) < 0.000001)
+
+	def testFindOptimalSplit_regression(self):
+		testdataset = data.DataSet(self.split_fname)
+		resultthreshold, resultattribute, resultgain = objectives.find_optimal_split(testdataset, 'medium_split', regression=True)
+		left, right = testdataset.split_data(resultattribute, resultthreshold)
+		targets = testdataset.get_column('medium_split')
+		expectedgain = np.var(targets) - (len(left) * np.var(left.get_column('medium_split')) + len(right) * np.var(right.get_column('medium_split'))) / float(len(testdataset))
+
+		self.assertEqual(resultattribute, 'easy_split')
+		self.assertTrue(abs(resultgain-expectedgain) < 0.000001)
+
+	def testBestSortedThreshold_minLeaf(self):
+		values = np.arange(10)
+		codes = np.array([0, 0, 1, 1, 1, 1, 1, 1, 1, 1])
+
+		self.assertEqual(objectives.best_sorted_threshold(values, codes, 2)[0], 2)
+		self.assertEqual(objectives.best_sorted_threshold(values, codes, 2, min_leaf=3)[0], 3)
+		self.assertEqual(objectives.best_sorted_threshold(values, codes, 2, sorted_weights=np.full(10, 2), min_leaf=3)[0], 2)
+		self.assertEqual(objectives.best_sorted_threshold(values, codes, 2, min_leaf=6), (None, 0))
+
+	def testFindHistogramSplit_easySplit(self):
+		testdataset = data.DataSet(self.split_fname)
+		classes, codes = testdataset.get_codes('label')
+		values, bins = testdataset.get_bins('easy_split', 8)
+		histograms = {'easy_split': np.bincount(bins * 2 + codes, minlength=values.shape[0] * 2).reshape(values.shape[0], 2)}
+		resultbin, resultattribute, resultgain = objectives.find_histogram_split(histograms, ['easy_split'])
+
+		self.assertEqual(values[resultbin], 3)
+		self.assertEqual(resultattribute, 'easy_split')
+		self.assertEqual(resultgain, 1.0)
+
 	def testCountLabelsPerformance(self):
 		testdataset = data.DataSet(self.performance_fname)
 		result_count_int = testdataset.count_labels('int')
@@ -6,6 +6,9 @@ import objectives
 import random_forest
 
 import numpy as np
+import os
+import shutil
+import tempfile
 import unittest
 
 class TestRandomForest(unittest.TestCase):
@@ -13,6 +16,7 @@ class TestRandomForest(unittest.TestCase):
 	def setUp(self):
 		self.mixeddata_fname = '../testdata/test_mixeddata.csv'
 		self.performance_fname = '../testdata/test_performancedata.csv'
+		self.leastsquares_fname = '../testdata/test_leastsquares.csv'
 		self.randomforest_fname = '../testdata/test_randomforestdata.csv'
 		self.randomforest2_fname = '../testdata/test_randomforestdata2.csv'
 		self.randomforestperformance_fname = '../testdata/test_randomforestperformance.csv'
@@ -38,6 +42,225 @@ class TestRandomForest(unittest.TestCase):
 			self.assertEqual(probability.values()[0], 1.0)
 			self.assertEqual(len(probability), 1)
 
+	def testGrowTree_presortedRootSplit(self):
+		testdataset = data.DataSet(self.randomforest2_fname)
+		testtree = random_forest.Tree(testdataset, max_depth=1, label='label', m=2)
+		threshold, attribute, gain = objectives.find_optimal_split(testdataset, 'label')
+
+		self.assertEqual(testtree.root.attribute, attribute)
+		self.assertEqual(testtree.root.threshold, threshold)
+
+	def testGrowTree_leafCounts(self):
+		testdataset = data.DataSet(self.randomforest_fname)
+		testtree = random_forest.Tree(testdataset, max_depth=1, label='label', m=2)
+		left, right = testdataset.split_data(testtree.root.attribute, testtree.root.threshold)
+
+		for node, split in [(testtree.root.left_node, left), (testtree.root.right_node, right)]:
+			counts = split.count_labels('label')
+			total = float(sum(counts.values()))
+			self.assertEqual(node.probabilities, dict((key, value/total) for key, value in counts.items()))
+
+	def testFlattenTree(self):
+		testdataset = data.DataSet(self.randomforest2_fname)
+		testtree = random_forest.Tree(testdataset, max_depth=2, label='label', m=2)
+		flat = testtree.flatten()
+
+		self.assertEqual(len(flat), 7)
+		self.assertEqual(flat.attributes[flat.feature[0]], testtree.root.attribute)
+		self.assertEqual(list(flat.feature[flat.left == -1]), [-1, -1, -1, -1])
+		for datapoint in testdataset.datapoints:
+			self.assertEqual(flat.get_probabilities(datapoint), testtree.root.predict(datapoint))
+
+	def testGrowTree_releasesData(self):
+		testdataset = data.DataSet(self.randomforestperformance_fname)
+		testtree = random_forest.Tree(testdataset, max_depth=3, label='label', m=2, seed=0)
+		nodes = [testtree.root]
+		while nodes:
+			node = nodes.pop()
+			self.assertEqual(node.dataset, None)
+			if not node.is_leaf():
+				nodes += [node.left_node, node.right_node]
+
+		flat = testtree.flatten()
+		for datapoint in testdataset.datapoints[::50]:
+			self.assertEqual(testtree.root.predict(datapoint), flat.get_probabilities(datapoint))
+
+	def testGrowTree_histogramMatchesExact(self):
+		testdataset = data.DataSet(self.randomforest2_fname)
+		exact = random_forest.Tree(testdataset, max_depth=2, label='label', m=2, seed=0).flatten()
+		histogram = random_forest.Tree(testdataset, max_depth=2, label='label', m=2, seed=0, n_bins=16).flatten()
+
+		self.assertTrue(np.array_equal(histogram.feature, exact.feature))
+		self.assertTrue(np.array_equal(histogram.threshold, exact.threshold))
+		self.assertTrue(np.array_equal(histogram.membership, exact.membership))
+		self.assertTrue(np.array_equal(histogram.value, exact.value))
+
+	def testGrowTree_levelWiseMatchesDepthFirst(self):
+		rng = np.random.RandomState(0)
+		datapoints = np.zeros(300, dtype=[('x1', np.dtype(float)), ('x2', np.dtype(float)), ('word', np.dtype(object)), ('label', np.dtype(object)), ('target', np.dtype(float))])
+		datapoints['x1'] = rng.normal(size=300)
+		datapoints['x2'] = rng.normal(size=300)
+		datapoints['word'] = np.array(['a', 'b', 'c', 'd', 'e'], dtype=object)[rng.randint(0, 5, size=300)]
+		datapoints['target'] = datapoints['x1'] + 2 * (datapoints['word'] == 'c') + rng.normal(size=300) * 0.1
+		datapoints['label'] = np.where(datapoints['target'] > 0.5, 'yes', 'no')
+		testdataset = data.DataSet(datapoints=datapoints)
+		classification = testdataset.view(attributes=['x1', 'x2', 'word', 'label'])
+		regression = testdataset.view(rows=np.arange(300), attributes=['x1', 'x2', 'word', 'target'], weights=rng.randint(0, 3, size=300))
+
+		for dataset, label, is_regression in [(classification, 'label', False), (regression, 'target', True)]:
+			for n_bins in [8, 16]:
+				options = dict(max_depth=4, label=label, m=3, seed=0, n_bins=n_bins, regression=is_regression)
+				depth_first = random_forest.Tree(dataset, **options).flatten()
+				level_wise = random_forest.Tree(dataset, level_wise=True, **options).flatten()
+				for name in random_forest.FlatTree.ARRAYS:
+					self.assertTrue(np.allclose(getattr(level_wise, name), getattr(depth_first, name)))
+
+	def testGrowTree_stoppingCriteria(self):
+		rng = np.random.RandomState(0)
+		datapoints = np.zeros(200, dtype=[('x1', np.dtype(float)), ('x2', np.dtype(float)), ('label', np.dtype(object))])
+		datapoints['x1'] = rng.normal(size=200)
+		datapoints['x2'] = rng.normal(size=200)
+		datapoints['label'] = np.where(datapoints['x1'] + datapoints['x2'] + rng.normal(size=200) > 0, 'yes', 'no')
+		testdataset = data.DataSet(datapoints=datapoints)
+		full = random_forest.Tree(testdataset, max_depth=20, label='label', m=2, seed=0).flatten()
+
+		for n_bins in [None, 16]:
+			options = dict(max_depth=20, label='label', m=2, seed=0, n_bins=n_bins)
+			leaves = random_forest.Tree(testdataset, min_samples_leaf=10, **options).flatten()
+			self.assertTrue(np.bincount(leaves.apply(datapoints))[leaves.feature == -1].min() >= 10)
+			self.assertTrue(len(leaves) < len(full))
+
+			limited = random_forest.Tree(testdataset, max_leaf_nodes=5, **options).flatten()
+			self.assertEqual(np.count_nonzero(limited.feature == -1), 5)
+			self.assertEqual(len(random_forest.Tree(testdataset, min_gain=1.0, **options).flatten()), 1)
+			self.assertEqual(len(random_forest.Tree(testdataset, min_samples_split=201, **options).flatten()), 1)
+
+		self.assertRaises(ValueError, random_forest.Tree, testdataset, 3, 'label', 2, n_bins=16, level_wise=True, max_leaf_nodes=4)
+		self.assertRaises(ValueError, random_forest.Tree, testdataset, 3, 'label', 2, level_wise=True)
+
+	def testGrowTree_regression(self):
+		testdataset = data.DataSet(self.leastsquares_fname)
+		testtree = random_forest.Tree(testdataset, max_depth=1, label='label', m=1, regression=True)
+
+		self.assertEqual(testtree.root.attribute, 'predictor')
+		self.assertEqual(testtree.root.threshold, 1)
+		self.assertEqual(testtree.root.left_node.mean, 1.0)
+		self.assertEqual(testtree.root.right_node.mean, 4.5)
+		self.assertEqual(list(testtree.flatten().predict_batch_values(testdataset.datapoints)), [1.0, 1.0, 4.5, 4.5])
+
+	def testGrowForest_regression(self):
+		testdataset = data.DataSet(self.leastsquares_fname)
+		testforest = random_forest.RandomForest(testdataset, 'label', regression=True)
+		testforest.grow(size=5, max_depth=2, m=1, seed=0)
+		predictions = testforest.predict(testdataset.datapoints)
+
+		self.assertEqual(predictions['_prediction'].dtype, np.dtype(float))
+		self.assertTrue(np.all((predictions['_prediction'] >= 0) & (predictions['_prediction'] <= 5)))
+
+	def testGrowForest_outOfBag(self):
+		testdataset = data.DataSet(self.randomforest2_fname)
+		testforest = random_forest.RandomForest(testdataset, 'label')
+		testforest.grow(size=1, max_depth=2, m=2, seed=0, oob=True)
+		scored = testforest.oob_counts > 0
+		probabilities = testforest.forest[0].predict_batch_probabilities(testdataset.datapoints)
+		errors = testforest.oob_predictions[scored] != testdataset.get_column('label')[scored]
+
+		self.assertTrue(scored.any() and not scored.all())
+		self.assertTrue(np.array_equal(testforest.oob_scores[scored], probabilities[scored]))
+		self.assertTrue(np.all(np.isnan(testforest.oob_scores[~scored])))
+		self.assertEqual(testforest.oob_error, errors.mean())
+
+		testforest.grow(size=2, max_depth=2, m=2, seed=0, oob=True)
+		testforest.grow(size=3, max_depth=2, m=2, seed=1)
+		for name in ['oob_votes', 'oob_counts', 'oob_scores', 'oob_predictions', 'oob_error']:
+			self.assertTrue(getattr(testforest, name) is None)
+
+	def testGrowForest_maxSamples(self):
+		cache_dir = tempfile.mkdtemp()
+		try:
+			testdataset = data.DataSet(self.randomforestperformance_fname, cache_dir=cache_dir)
+			sample_size = int(round(0.1 * len(testdataset)))
+			serial, parallel = random_forest.RandomForest(testdataset, 'label'), random_forest.RandomForest(testdataset, 'label')
+			stats = random_forest.GrowthStats()
+			serial.grow(size=4, max_depth=3, m=2, seed=0, max_samples=0.1, replace=False, oob=True, stats=stats)
+			parallel.grow(size=4, max_depth=3, m=2, seed=0, max_samples=0.1, replace=False, oob=True, n_jobs=2)
+
+			self.assertEqual([stats.counts[(tree, 0)]['rows'] for tree in range(4)], [sample_size] * 4)
+			self.assertEqual(serial.oob_counts.sum(), 4 * (len(testdataset) - sample_size))
+			self.assertTrue(np.array_equal(serial.oob_counts, parallel.oob_counts))
+			for tree, paralleltree in zip(serial.forest, parallel.forest):
+				self.assertTrue(np.array_equal(tree.feature, paralleltree.feature))
+
+			for max_samples in [0, 0.0, -0.5, 1.5, -3, True]:
+				self.assertRaises(ValueError, serial.grow, max_samples=max_samples)
+			self.assertRaises(ValueError, serial.grow, max_samples=len(testdataset) + 1, replace=False)
+			serial.grow(size=1, max_depth=1, m=2, seed=0, max_samples=1e-9, stats=stats)
+			self.assertEqual(stats.counts[(4, 0)]['rows'], 1)
+		finally:
+			shutil.rmtree(cache_dir)
+
+	def testGrowForest_warmStart(self):
+		testdataset = data.DataSet(self.randomforest2_fname)
+		expected = random_forest.RandomForest(testdataset, 'label')
+		expected.grow(size=6, max_depth=2, m=2, seed=0, oob=True)
+		testforest = random_forest.RandomForest(testdataset, 'label')
+		testforest.grow(size=2, max_depth=2, m=2, seed=0, oob=True)
+		first = testforest.forest[0]
+		testforest.grow(size=6, max_depth=2, m=2, oob=True, warm_start=True)
+
+		self.assertTrue(testforest.forest[0] is first)
+		self.assertEqual(len(testforest.forest), 6)
+		for tree, expectedtree in zip(testforest.forest, expected.forest):
+			self.assertTrue(np.array_equal(tree.feature, expectedtree.feature))
+			self.assertTrue(np.array_equal(tree.threshold, expectedtree.threshold))
+		self.assertTrue(np.array_equal(testforest.oob_counts, expected.oob_counts))
+		self.assertEqual(testforest.oob_error, expected.oob_error)
+
+	def testGrowForest_untilConverged(self):
+		testdataset = data.DataSet(self.randomforest2_fname)
+		testforest = random_forest.RandomForest(testdataset, 'label')
+		size = testforest.grow_until_converged(20, batch_size=4, patience=2, max_depth=2, m=2, seed=0)
+
+		self.assertEqual(size, len(testforest.forest))
+		self.assertEqual(len(testforest.errors), (size + 3) // 4)
+		self.assertEqual(testforest.errors[-1], testforest.oob_error)
+		self.assertTrue(size == 20 or len(testforest.errors) > 2)
+
+	def testGrowthStats(self):
+		testdataset = data.DataSet(self.randomforest2_fname)
+		stats = random_forest.GrowthStats()
+		flat = random_forest.Tree(testdataset, max_depth=2, label='label', m=2, seed=0, stats=stats).flatten()
+		by_depth = stats.by_depth()
+
+		self.assertEqual(by_depth[0]['nodes'], 1)
+		self.assertEqual(by_depth[0]['rows'], len(testdataset))
+		self.assertEqual(sum(counts['nodes'] for counts in stats.counts.values()), len(flat))
+		self.assertEqual(sum(counts['leaves'] for counts in stats.counts.values()), (flat.feature == -1).sum())
+		self.assertTrue(by_depth[0]['candidates'] > 0)
+		self.assertTrue(stats.folded()[0].startswith('forest;tree 0;sort '))
+
+		testforest = random_forest.RandomForest(testdataset, 'label')
+		stats = random_forest.GrowthStats()
+		testforest.grow(size=3, max_depth=2, m=2, seed=0, stats=stats)
+		self.assertEqual(stats.trees, 3)
+		self.assertTrue(all(not hasattr(tree, 'stats') for tree in testforest.forest))
+
+	def testSaveLoadForest(self):
+		testdataset = data.DataSet(self.randomforestperformance_fname)
+		directory = tempfile.mkdtemp()
+		try:
+			for label, regression in [('label', False), ('int', True)]:
+				testforest = random_forest.RandomForest(testdataset, label, regression=regression)
+				testforest.grow(size=4, max_depth=3, m=2, seed=0)
+				testforest.save(directory)
+				loaded = random_forest.RandomForest.load(directory)
+
+				self.assertEqual(len(loaded.forest), 4)
+				self.assertTrue(isinstance(loaded.forest[0].value, np.memmap))
+				self.assertTrue(np.array_equal(loaded.predict(testdataset.datapoints), testforest.predict(testdataset.datapoints)))
+		finally:
+			shutil.rmtree(directory)
+
 	def testTreePredict(self):
 		testdataset = data.DataSet(self.randomforest2_fname, ratio_validation=0.25, shuffle=True)
 		testtree = random_forest.Tree(testdataset, max_depth=2, label='label', m=2)
@@ -70,6 +293,51 @@ class TestRandomForest(unittest.TestCase):
 
 		# results are too random for asserts
 
+	def testGrowForest_seedReproducible(self):
+		testdataset = data.DataSet(self.randomforest2_fname, ratio_validation=0.25, shuffle=True)
+		testforest = random_forest.RandomForest(testdataset, 'label')
+		testforest.grow(size=10, max_depth=2, m=1, seed=7)
+		expected = testforest.predict(testdataset.validation_datapoints)
+		testforest.grow(size=10, max_depth=2, m=1, seed=7, n_jobs=2)
+		predictions = testforest.predict(testdataset.validation_datapoints)
+		directory = testforest.store_directory
+		testforest.grow(size=10, max_depth=2, m=1, seed=7, n_jobs=2)
+
+		self.assertTrue(np.array_equal(predictions, expected))
+		self.assertTrue(np.array_equal(testforest.predict(testdataset.validation_datapoints), expected))
+		self.assertEqual(testforest.store_directory, directory)
+		del testforest
+		self.assertFalse(os.path.exists(directory))
+
+	def testPredictBatch_matchesSingleRows(self):
+		testdataset = data.DataSet(self.randomforestperformance_fname, ratio_validation=0.05, shuffle=True)
+		testforest = random_forest.RandomForest(testdataset, 'label')
+		testforest.grow(size=5, max_depth=3, m=2)
+		validation = testdataset.validation_datapoints
+		probabilities = testforest.predict_probabilities(validation)
+
+		for index in range(validation.shape[0]):
+			expected = sum(tree.predict_probabilities(validation[index]) for tree in testforest.forest) / len(testforest.forest)
+			self.assertTrue(np.allclose(probabilities[index], expected))
+
+	def testGrowForest_histogram(self):
+		testdataset = data.DataSet(self.randomforestperformance_fname, ratio_validation=0.25, shuffle=True)
+		testforest = random_forest.RandomForest(testdataset, 'label')
+		testforest.grow(size=5, max_depth=3, m=2, n_bins=4)
+		predictions = testforest.predict(testdataset.validation_datapoints)
+
+		self.assertEqual(predictions.shape, testdataset.validation_datapoints.shape)
+
+	def testPredict_textDecoded(self):
+		testdataset = data.DataSet(self.randomforestperformance_fname)
+		testforest = random_forest.RandomForest(testdataset, 'text')
+		testforest.grow(size=3, max_depth=2, m=2)
+		datapoints = np.array([(1, 'hi', True), (2, 'unseen', False)], dtype=[('int', 'int64'), ('text', 'object'), ('label', 'bool')])
+		predictions = testforest.predict(datapoints)
+
+		self.assertEqual(predictions['_prediction'].dtype, np.dtype(object))
+		self.assertTrue(all(prediction in ('hi', 'hello') for prediction in predictions['_prediction']))
+
 	# def testGrowForestPerformance(self):
 	# 	testdataset = data.DataSet(self.randomforestperformance_fname, ratio_validation=0.25, shuffle=True)
 	# 	testforest = random_forest.RandomForest(testdataset, 'text')
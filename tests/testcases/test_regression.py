@@ -52,5 +52,67 @@ class TestObjectives(unittest.TestCase):
 		prediction = testregression.predict(0)
 		self.assertTrue(abs(prediction - 1.9) < 0.0001)
 
+	def testLeastSquares_multivariate(self):
+		rng = np.random.RandomState(0)
+		datapoints = np.zeros(200, dtype=[('x1', 'float64'), ('x2', 'float64'), ('x3', 'int64'), ('label', 'float64')])
+		datapoints['x1'] = rng.normal(size=200)
+		datapoints['x2'] = rng.normal(size=200)
+		datapoints['x3'] = rng.randint(0, 10, size=200)
+		datapoints['label'] = 2 * datapoints['x1'] - 3 * datapoints['x2'] + 0.5 * datapoints['x3'] + 4
+		testdataset = data.DataSet(datapoints=datapoints)
+
+		for solver in ['qr', 'cholesky']:
+			testregression = regression.LinearRegression(testdataset)
+			testregression.least_squares(['x1', 'x2', 'x3'], 'label', solver=solver)
+			self.assertTrue(np.allclose(testregression.coefficients, [2, -3, 0.5]))
+			self.assertTrue(abs(testregression.intercept - 4) < 0.0001)
+			self.assertTrue(np.allclose(testregression.predict(testdataset), datapoints['label']))
+			self.assertTrue(np.allclose(testregression.predict(datapoints), datapoints['label']))
+
+	def testLeastSquares_ridge(self):
+		testdataset = data.DataSet(self.standard_fname)
+		ridge, qr = regression.LinearRegression(testdataset), regression.LinearRegression(testdataset)
+		ridge.least_squares(['predictor'], 'label', ridge=5.0)
+		qr.least_squares(['predictor'], 'label', ridge=5.0, solver='qr')
+
+		self.assertTrue(0 < ridge.b1 < 1.7)
+		self.assertTrue(abs(ridge.b1 - qr.b1) < 0.000001)
+
+	def testLeastSquares_weighted(self):
+		testdataset = data.DataSet(self.standard_fname)
+		weighted = testdataset.view(rows=np.array([0, 1, 2, 3]), weights=np.array([1, 3, 1, 2]))
+		testregression = regression.LinearRegression(weighted)
+		testregression.least_squares('predictor', 'label')
+		expected = regression.LinearRegression(data.DataSet(datapoints=weighted.datapoints))
+		expected.least_squares('predictor', 'label')
+
+		self.assertTrue(abs(testregression.b1 - expected.b1) < 0.000001)
+		self.assertTrue(abs(testregression.b0 - expected.b0) < 0.000001)
+		self.assertTrue(np.allclose(testregression.predict([0, 1]), [expected.b0, expected.b0 + expected.b1]))
+
+	def testStreamingLeastSquares(self):
+		testdataset = data.DataSet(self.standard_fname)
+		expected = regression.LinearRegression(testdataset)
+		expected.least_squares('predictor', 'label')
+
+		view = testdataset.view(rows=np.array([3, 0, 2, 1]))
+		for source, chunk_size, n_jobs in [(None, 2, 1), (view, 3, 1), (self.standard_fname, 1, 1), (self.standard_fname, 3, 2)]:
+			testregression = regression.LinearRegression(testdataset)
+			statistics = testregression.streaming_least_squares('predictor', 'label', source=source, chunk_size=chunk_size, n_jobs=n_jobs)
+			self.assertEqual(statistics.count, len(testdataset))
+			self.assertTrue(abs(testregression.b1 - expected.b1) < 0.000001)
+			self.assertTrue(abs(testregression.b0 - expected.b0) < 0.000001)
+
+	def testSufficientStatistics_merge(self):
+		rng = np.random.RandomState(0)
+		columns = rng.normal(loc=1e6, size=(100, 3))
+		whole = regression.SufficientStatistics(3).update(columns)
+		merged = regression.SufficientStatistics(3).update(columns[60:]).merge(regression.SufficientStatistics(3).update(columns[:60]))
+
+		self.assertEqual(merged.count, 100)
+		self.assertTrue(np.allclose(merged.means, whole.means))
+		self.assertTrue(np.allclose(merged.comoments, whole.comoments))
+		self.assertTrue(np.allclose(merged.comoments, np.cov(columns.T, bias=True) * 100))
+
 if __name__ == '__main__':
 	unittest.main()
\ No newline at end of file